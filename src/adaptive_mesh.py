@@ -0,0 +1,292 @@
+import numpy as np
+
+from heightmap_mesh import boundary_shell, frame_offsets
+
+
+# Adaptivní triangulace výškové mapy s přibližnou svislou tolerancí (RTIN - Right-Triangulated
+# Irregular Network, stejný princip jako knihovna Martini). Mřížka se rekurzivně dělí na
+# pravoúhlé trojúhelníky; trojúhelník se dělí, když se výška ve středu jeho přepony
+# (nebo v podstromu) liší od lineární interpolace o více než `max_error` (mm).
+# Chyba se měří jen ve středech přepon, ne ve všech pokrytých pixelech, takže
+# `max_error` je přibližná tolerance, ne zaručené maximum odchylky. Rovné plochy
+# (např. po prahování) se zredukují na několik málo trojúhelníků. Výpočet probíhá
+# po úrovních vektorově.
+
+
+def _tile_size(rows, cols):
+    """Nejmenší mocnina dvou, která pokryje mřížku (počet čtverců, ne vrcholů)."""
+    size = 1
+    while size < max(rows, cols) - 1:
+        size *= 2
+    return size
+
+
+def _children(a, b, c):
+    """Rozdělí trojúhelníky (a, b, c) v polovině přepony a-b na dvojice potomků."""
+    m = (a + b) // 2
+    na = np.stack((c, b), axis=1).reshape(-1, 2)
+    nb = np.stack((a, c), axis=1).reshape(-1, 2)
+    nc = np.repeat(m, 2, axis=0)
+    return na, nb, nc
+
+
+def _root_triangles(size):
+    a = np.array([[0, 0], [size, size]], dtype=np.int32)
+    b = np.array([[size, size], [0, 0]], dtype=np.int32)
+    c = np.array([[size, 0], [0, size]], dtype=np.int32)
+    return a, b, c
+
+
+def _level_triangles(size):
+    """Počet trojúhelníků všech úrovní dělení mřížky size x size (jeden průchod)."""
+    return 2 * size * size - 2
+
+
+def rtin_errors(z, size, progress=None, inside=None):
+    """
+    Spočítá pro každý vrchol rozšířené mřížky (size + 1)^2 maximální chybu podstromu
+    trojúhelníků, jejichž přepona má v tomto vrcholu střed. Souřadnice jsou (x, y).
+    Doplněná část mřížky má výšky okraje mapy, takže trojúhelníky přesahující okraj
+    se dělí jen podle chyby (a pak se ořežou, viz `rtin_triangles`); trojúhelníky
+    zcela mimo mapu chybu nemají. S maskou pixelů `inside`
+    dostanou nekonečnou chybu i trojúhelníky, jejichž rohy a střed přepony leží zčásti
+    v masce a zčásti mimo ni, takže se u okraje masky dělí až na nejmenší trojúhelníky.
+    `progress(hotovo)` se volá po každé úrovni s počtem dosud zpracovaných
+    trojúhelníků (oba průchody dohromady 2 * `_level_triangles(size)`).
+    """
+    rows, cols = z.shape
+    grid = size + 1
+    # Rozšíření výškové mapy na čtvercovou mřížku opakováním okrajových hodnot.
+    heights = np.pad(
+        np.asarray(z, dtype=np.float32),
+        ((0, grid - rows), (0, grid - cols)),
+        mode="edge",
+    ).ravel()
+    x_max, y_max = cols - 1, rows - 1
+    masked = None
+    if inside is not None:
+        masked = np.pad(
+            np.asarray(inside, dtype=bool), ((0, grid - rows), (0, grid - cols))
+        ).ravel()
+
+    # Průchod shora dolů: středy přepon a vlastní chyby pro každou úroveň.
+    levels = []
+    done = 0
+    a, b, c = _root_triangles(size)
+    while np.abs(a - c).sum(axis=1)[0] > 1:
+        m = (a + b) // 2
+        mid = m[:, 1] * grid + m[:, 0]
+        ia = a[:, 1] * grid + a[:, 0]
+        ib = b[:, 1] * grid + b[:, 0]
+        own = np.abs((heights[ia] + heights[ib]) * 0.5 - heights[mid])
+
+        x_lo = np.minimum(np.minimum(a[:, 0], b[:, 0]), c[:, 0])
+        y_lo = np.minimum(np.minimum(a[:, 1], b[:, 1]), c[:, 1])
+        own[(x_lo >= x_max) | (y_lo >= y_max)] = 0.0
+        if masked is not None:
+            ic = c[:, 1] * grid + c[:, 0]
+            count = masked[ia].astype(np.int8) + masked[ib] + masked[ic] + masked[mid]
+            own[(count > 0) & (count < 4)] = np.inf
+
+        levels.append((mid, own))
+        a, b, c = _children(a, b, c)
+        if progress is not None:
+            done += len(mid)
+            progress(done)
+
+    # Průchod zdola nahoru: chyba vrcholu je maximum vlastní chyby a chyb potomků.
+    # Střed přepony sdílí dva sousední trojúhelníky, proto se chyby slučují přes maximum.
+    errors = np.zeros(grid * grid, dtype=np.float32)
+    child_mid = None
+    for mid, own in reversed(levels):
+        err = own
+        if child_mid is not None:
+            pairs = errors[child_mid].reshape(-1, 2)
+            err = np.maximum(err, pairs.max(axis=1))
+        np.maximum.at(errors, mid, err)
+        child_mid = mid
+        if progress is not None:
+            done += len(mid)
+            progress(done)
+    return errors
+
+
+def rtin_triangles(z, max_error, progress=None, inside=None):
+    """
+    Vrátí trojúhelníky adaptivní sítě jako pole (M, 3, 2) celočíselných souřadnic (x, y)
+    v pixelech výškové mapy, orientované proti směru hodinových ručiček.
+    `progress(hotovo, celkem)` hlásí průběh po úrovních (ve zpracovaných
+    trojúhelnících); výjimka z něj výpočet přeruší. Maska `inside` viz `rtin_errors`.
+    """
+    rows, cols = z.shape
+    size = _tile_size(rows, cols)
+    grid = size + 1
+    # Dva průchody výpočtu chyb a nejvýše jeden průchod výběru trojúhelníků.
+    total = 3 * _level_triangles(size)
+    report = None
+    if progress is not None:
+        report = lambda done: progress(done, total)
+    errors = rtin_errors(z, size, report, inside)
+    done = 2 * _level_triangles(size)
+    x_max, y_max = cols - 1, rows - 1
+
+    emitted = []
+    a, b, c = _root_triangles(size)
+    while len(a):
+        if progress is not None:
+            done += len(a)
+            progress(min(done, total), total)
+        m = (a + b) // 2
+        splittable = np.abs(a - c).sum(axis=1) > 1
+        split = splittable & (errors[m[:, 1] * grid + m[:, 0]] > max_error)
+        keep = ~split
+        emitted.append(np.stack((a[keep], b[keep], c[keep]), axis=1))
+        a, b, c = _children(a[split], b[split], c[split])
+
+    tri = np.concatenate(emitted)
+    # Odstranění trojúhelníků, které leží v doplněné části mřížky mimo výškovou mapu,
+    # a oříznutí trojúhelníků přesahujících její okraj.
+    inside = (tri[:, :, 0].min(axis=1) < x_max) & (tri[:, :, 1].min(axis=1) < y_max)
+    tri = tri[inside]
+    straddle = (tri[:, :, 0].max(axis=1) > x_max) | (tri[:, :, 1].max(axis=1) > y_max)
+    if straddle.any():
+        clipped = _clip_triangles(tri[straddle], x_max, y_max)
+        tri = np.concatenate((tri[~straddle], clipped))
+
+    # Sjednocení orientace: kladná plocha při pohledu shora.
+    d1 = tri[:, 1] - tri[:, 0]
+    d2 = tri[:, 2] - tri[:, 0]
+    flip = d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0] < 0
+    tri[flip, 1], tri[flip, 2] = tri[flip, 2], tri[flip, 1]
+    return tri
+
+
+def _clip_polygons(points, valid, axis, limit):
+    """
+    Ořízne konvexní mnohoúhelníky (N, K, 2) s platnými vrcholy `valid` (N, K)
+    polorovinou souřadnice `axis` <= `limit` (Sutherland-Hodgman po celých polích).
+    Vrchol se zachová, leží-li uvnitř; hrana, která hranici ostře protíná, přidá
+    průsečík. Hrany trojúhelníků RTIN jsou vodorovné, svislé nebo pod 45°, takže
+    průsečíky s celočíselnou hranicí leží opět ve vrcholech mřížky.
+    Vrací (body (N, 2K, 2), platnost (N, 2K)) s platnými vrcholy na začátku řádku.
+    """
+    count = valid.sum(axis=1)
+    k = points.shape[1]
+    # Následující platný vrchol (cyklicky) pro každou hranu.
+    step = np.arange(k) + 1
+    nxt = np.where(step[None, :] < count[:, None], step[None, :], 0)
+    following = np.take_along_axis(points, nxt[:, :, None], axis=1)
+
+    p, q = points[:, :, axis], following[:, :, axis]
+    keep = valid & (p <= limit)
+    cross = valid & (((p < limit) & (q > limit)) | ((p > limit) & (q < limit)))
+    delta = following - points
+    t = np.where(cross, (limit - p) / np.where(cross, q - p, 1), 0.0)
+    hit = points + np.rint(delta * t[:, :, None]).astype(points.dtype)
+
+    out = np.stack((points, hit), axis=2).reshape(len(points), 2 * k, 2)
+    ok = np.stack((keep, cross), axis=2).reshape(len(points), 2 * k)
+    order = np.argsort(~ok, axis=1, kind="stable")
+    out = np.take_along_axis(out, order[:, :, None], axis=1)
+    return out, np.take_along_axis(ok, order, axis=1)
+
+
+def _clip_triangles(tri, x_max, y_max):
+    """
+    Ořízne trojúhelníky (M, 3, 2) na obdélník výškové mapy a oříznuté
+    mnohoúhelníky rozloží vějířem zpět na trojúhelníky (nulové plochy vynechá).
+    """
+    valid = np.ones(tri.shape[:2], dtype=bool)
+    points, valid = _clip_polygons(tri, valid, 0, x_max)
+    points, valid = _clip_polygons(points, valid, 1, y_max)
+
+    fans = []
+    for j in range(1, points.shape[1] - 1):
+        fan = np.stack((points[:, 0], points[:, j], points[:, j + 1]), axis=1)
+        fans.append(fan[valid[:, j + 1]])
+    fan = np.concatenate(fans)
+    d1 = fan[:, 1] - fan[:, 0]
+    d2 = fan[:, 2] - fan[:, 0]
+    return fan[d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0] != 0]
+
+
+def _indexed_surface(x, y, z, max_error, progress=None, inside=None):
+    """Převede adaptivní trojúhelníky na sdílené vrcholy (float32) a indexy (int32)."""
+    rows, cols = z.shape
+    tri = rtin_triangles(z, max_error, progress, inside)
+    flat = tri[:, :, 1].astype(np.int64) * cols + tri[:, :, 0]
+    used, faces = np.unique(flat.ravel(), return_inverse=True)
+    r, col = np.divmod(used, cols)
+
+    vertices = np.empty((len(used), 3), dtype=np.float32)
+    vertices[:, 0] = x[col]
+    vertices[:, 1] = y[r]
+    vertices[:, 2] = z[r, col]
+    return vertices, faces.reshape(-1, 3).astype(np.int32), r, col
+
+
+def build_adaptive_relief(x, y, z, max_error, inside=None, progress=None):
+    """
+    Sestaví samotný povrch reliéfu (bez tloušťky) s přibližnou tolerancí `max_error` mm
+    (měřenou ve středech přepon, viz popis modulu).
+    S maskou pixelů `inside` se síť u okraje masky zjemní až na nejmenší trojúhelníky
+    (viz `rtin_errors`) a zůstanou jen trojúhelníky, jejichž všechny vrcholy leží
+    v masce. `progress` viz `rtin_triangles`.
+    """
+    vertices, faces, r, col = _indexed_surface(
+        x, y, z, max_error, progress, inside
+    )
+    if inside is not None:
+        faces = faces[inside[r, col][faces].all(axis=1)]
+    return vertices, faces
+
+
+def relief_triangle_bound(inside):
+    """
+    Horní mez počtu trojúhelníků `build_adaptive_relief` s maskou pixelů `inside`.
+    Každý ponechaný trojúhelník pokrývá aspoň jednu polovinu čtverce mřížky se všemi
+    třemi rohy v masce; čtverec se čtyřmi rohy v masce má dvě takové poloviny,
+    se třemi rohy nejvýše jednu.
+    """
+    corners = (
+        inside[:-1, :-1].astype(np.int8)
+        + inside[:-1, 1:]
+        + inside[1:, :-1]
+        + inside[1:, 1:]
+    )
+    return 2 * np.count_nonzero(corners == 4) + np.count_nonzero(corners == 3)
+
+
+def build_adaptive_solid(
+    x, y, z, max_error, z_base=0.0, margin=0.0, z_frame=None, progress=None
+):
+    """
+    Sestaví vodotěsné těleso s adaptivním horním povrchem. Boční stěny vedou
+    po okrajových vrcholech adaptivní sítě a plochá spodní plocha je vějíř
+    ze středového bodu; `margin` > 0 přidá rámeček ve výšce `z_frame`.
+    `progress` viz `rtin_triangles`.
+    """
+    rows, cols = z.shape
+    top, top_faces, r, col = _indexed_surface(x, y, z, max_error, progress)
+    n = len(top)
+
+    # Okrajové vrcholy seřazené proti směru hodinových ručiček podle polohy na obvodu.
+    w, h = cols - 1, rows - 1
+    on_edge = (r == 0) | (col == w) | (r == h) | (col == 0)
+    t = np.select(
+        [r == 0, col == w, r == h],
+        [col, w + r, w + h + (w - col)],
+        default=2 * w + h + (h - r),
+    )
+    loop_top = np.flatnonzero(on_edge)
+    loop_top = loop_top[np.argsort(t[loop_top], kind="stable")].astype(np.int32)
+
+    offset = None
+    if margin:
+        offset = frame_offsets(r[loop_top], col[loop_top], rows, cols, margin)
+    shell_vertices, shell_faces = boundary_shell(
+        loop_top, top[loop_top, :2], n, z_base, offset=offset, z_frame=z_frame
+    )
+    vertices = np.concatenate((top, shell_vertices))
+    faces = np.concatenate((top_faces, shell_faces))
+    return vertices, faces
@@ -0,0 +1,354 @@
+# src/batch.py
+
+# Dávkový (headless) režim pro převod celých složek obrázků na STL.
+# Modul záměrně neimportuje tkinter ani GUI, aby start na serveru zůstal rychlý.
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from export_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, ExportCache
+from heightmap_file import (
+    HEIGHTMAP_EXTENSION,
+    heightmap_from_image,
+    load_heightmap,
+    save_heightmap,
+)
+from instrumentation import Tracer
+from mesh_writer import MESH_FORMATS
+from processing import image_to_array, load_image_file, process_array
+from stl_generator import image_to_stl
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+# Vstupy dávky: obrázky a hotové výškové mapy (.hmap), které přeskočí zpracování.
+INPUT_EXTENSIONS = IMAGE_EXTENSIONS + (HEIGHTMAP_EXTENSION,)
+# Výstup "hmap" uloží zpracovanou výškovou mapu místo sítě.
+OUTPUT_FORMATS = sorted(MESH_FORMATS) + [HEIGHTMAP_EXTENSION[1:]]
+
+# Výchozí hodnoty odpovídají výchozímu stavu ovládacích prvků v GUI.
+DEFAULT_PROCESSING_PARAMS = {
+    "contrast": 1.0,
+    "brightness": 1.0,
+    "smoothing": 0.0,
+    "invert_colors": False,
+    "use_threshold": False,
+    "threshold_level": 128,
+    "dilate": 0,
+    "erode": 0,
+    "noise_reduction": 0,
+    "use_stroke": False,
+    "stroke_thickness": 3,
+    "use_artistic_smoothing": False,
+    "artistic_smoothing_strength": 0.0,
+    "artistic_smoothing_engine": "bilateral",
+    "high_precision": False,
+}
+
+DEFAULT_MODEL_PARAMS = {
+    "model_width_mm": 100.0,
+    "base_height": 2.0,
+    "model_height": 4.0,
+    "max_dimension": 4000,
+    "feature_size_mm": 0.2,
+    "max_error_mm": None,
+    "workers": None,
+    "mirror_output": False,
+    "is_binary": True,
+    "use_cutting_margin": False,
+    "export_relief_only": False,
+    "flat_bottom": True,
+}
+
+
+def load_preset(path):
+    """
+    Načte předvolbu parametrů z JSON souboru. Předvolba může obsahovat sekce
+    "processing" a "model", nebo plochý slovník se všemi klíči najednou.
+    Chybějící hodnoty se doplní výchozími.
+    """
+    data = {}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+    processing = data.get("processing", {})
+    model = data.get("model", {})
+    for key, value in data.items():
+        if key in DEFAULT_PROCESSING_PARAMS:
+            processing.setdefault(key, value)
+        elif key in DEFAULT_MODEL_PARAMS:
+            model.setdefault(key, value)
+
+    unknown = set(processing) - set(DEFAULT_PROCESSING_PARAMS)
+    if unknown:
+        names = ", ".join(sorted(unknown))
+        raise ValueError(f"Neznámé parametry zpracování: {names}")
+
+    return {
+        "processing": {**DEFAULT_PROCESSING_PARAMS, **processing},
+        "model": {**DEFAULT_MODEL_PARAMS, **model},
+    }
+
+
+def collect_inputs(sources):
+    """Rozbalí zadané složky a glob vzory na seřazený seznam obrázků bez duplicit."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                if name.lower().endswith(INPUT_EXTENSIONS):
+                    paths.append(os.path.join(source, name))
+        else:
+            for path in sorted(glob.glob(source, recursive=True)):
+                if path.lower().endswith(INPUT_EXTENSIONS) and os.path.isfile(path):
+                    paths.append(path)
+    return list(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+
+def output_paths(inputs, output_dir, output_format):
+    """
+    Přiřadí každému vstupu výstupní soubor ve složce `output_dir` podle názvu
+    bez přípony. Vstupy se stejným názvem (např. a.png a a.jpg, nebo x.png ze dvou
+    složek) si ponechají příponu vstupu a případně pořadové číslo, aby se
+    souběžné převody nepřepisovaly. Názvy se porovnávají bez ohledu na velikost
+    písmen kvůli souborovým systémům Windows a macOS.
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in inputs]
+    counts = {}
+    for stem in stems:
+        counts[stem.lower()] = counts.get(stem.lower(), 0) + 1
+    taken = set()
+    jobs = {}
+    for path, stem in zip(inputs, stems):
+        name = os.path.basename(path) if counts[stem.lower()] > 1 else stem
+        candidate, number = name, 1
+        while candidate.lower() in taken:
+            number += 1
+            candidate = f"{name}-{number}"
+        taken.add(candidate.lower())
+        jobs[path] = os.path.join(output_dir, f"{candidate}.{output_format}")
+    return jobs
+
+
+def convert_file(
+    image_path,
+    output_path,
+    preset,
+    track_memory=False,
+    profile_dir=None,
+    cache=None,
+):
+    """
+    Převede jeden obrázek na STL. Běží v samostatném procesu, proto vrací
+    pouze jednoduchý slovník s výsledkem, časy jednotlivých kroků, záznamy
+    etap z `Tracer` (volitelně s pamětí a cProfile dumpem) a stavem cache.
+    Vstup .hmap se nezpracovává a jde rovnou do generátoru; výstup .hmap
+    uloží zpracovanou výškovou mapu pro generování sítě jinde.
+    """
+    result = {"input": image_path, "output": output_path, "error": None}
+    result["cache"] = None
+    tracer = Tracer(track_memory=track_memory, profile_dir=profile_dir)
+    start = time.perf_counter()
+    try:
+        if image_path.lower().endswith(HEIGHTMAP_EXTENSION):
+            with tracer.stage("load"):
+                processed = load_heightmap(image_path)
+            t_loaded = t_processed = time.perf_counter()
+        else:
+            with tracer.stage("load"):
+                image = load_image_file(image_path)
+            t_loaded = time.perf_counter()
+            # Mezi zpracováním a generátorem putuje jediné pole, bez PIL.
+            processed = process_array(
+                image_to_array(image), tracer=tracer, **preset["processing"]
+            )
+            t_processed = time.perf_counter()
+        if output_path.lower().endswith(HEIGHTMAP_EXTENSION):
+            with tracer.stage("hmap.save"):
+                heights, inside = heightmap_from_image(processed)
+                save_heightmap(output_path, heights, preset["model"], inside)
+            outcome = True
+        else:
+            outcome = image_to_stl(
+                processed, output_path, preset["model"], lambda p: None, tracer, cache
+            )
+        t_done = time.perf_counter()
+        if outcome is not True:
+            result["error"] = f"{type(outcome).__name__}: {outcome}"
+        result["load_s"] = t_loaded - start
+        result["process_s"] = t_processed - t_loaded
+        result["mesh_s"] = t_done - t_processed
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["total_s"] = time.perf_counter() - start
+    for record in tracer.records:
+        if record["name"] == "stl.cache":
+            result["cache"] = "hit" if record["hit"] else "miss"
+    result["trace"] = tracer.to_dict()
+    return result
+
+
+def run_batch(
+    inputs,
+    output_dir,
+    preset,
+    workers=None,
+    report=print,
+    json_log=False,
+    track_memory=False,
+    profile_dir=None,
+    cache=None,
+    output_format="stl",
+):
+    """
+    Spustí převod všech souborů v poolu procesů (výchozí je počet jader CPU).
+    Průběžně hlásí výsledky funkcí `report` (při `json_log` jako jeden JSON objekt
+    na řádek včetně záznamů etap) a vrací seznam výsledků ve vstupním pořadí.
+    `output_format` je přípona výstupu ("stl", "stl.gz", "3mf", "ply" nebo "hmap").
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if preset["model"].get("workers") is None:
+        # Jádra se dělí mezi procesy dávky a vlákna generování sítě.
+        processes = workers or os.cpu_count() or 1
+        threads = max(1, (os.cpu_count() or 1) // min(processes, len(inputs) or 1))
+        preset = {**preset, "model": {**preset["model"], "workers": threads}}
+    jobs = output_paths(inputs, output_dir, output_format)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                convert_file, path, out, preset, track_memory, profile_dir, cache
+            ): path
+            for path, out in jobs.items()
+        }
+        for future in as_completed(futures):
+            res = future.result()
+            results[futures[future]] = res
+            if json_log:
+                report(json.dumps(res))
+            elif res["error"]:
+                report(
+                    f"FAIL {res['input']} ({res['total_s']:.2f}s): {res['error']}"
+                )
+            elif res["cache"] == "hit":
+                report(
+                    f"OK   {res['input']} -> {res['output']} "
+                    f"({res['total_s']:.2f}s, cached)"
+                )
+            else:
+                report(
+                    f"OK   {res['input']} -> {res['output']} "
+                    f"({res['total_s']:.2f}s: load {res['load_s']:.2f}s, "
+                    f"process {res['process_s']:.2f}s, mesh {res['mesh_s']:.2f}s)"
+                )
+    return [results[path] for path in inputs]
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Batch conversion of images to STL reliefs (no GUI).",
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="Image files, directories or glob patterns."
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="stl_output", help="Output directory."
+    )
+    parser.add_argument(
+        "-p", "--preset", help="JSON file with processing and model parameters."
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: all CPU cores).",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="stl",
+        help="Output format (default: stl).",
+    )
+    parser.add_argument(
+        "--report", help="Write per-file results as JSON to this file."
+    )
+    parser.add_argument(
+        "--json-log",
+        action="store_true",
+        help="Print one JSON object per file with per-stage instrumentation.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Record peak allocated bytes per stage (tracemalloc, slower).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Export cache directory (default: {DEFAULT_CACHE_DIR}).",
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        type=float,
+        default=DEFAULT_CACHE_MAX_BYTES / 1024**2,
+        help="Maximum total size of the export cache in MB (default: 2048).",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the export cache."
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Write a cProfile dump per conversion to this directory.",
+    )
+    return parser
+
+
+def main(argv=None):
+    """Vstupní bod dávkového režimu. Vrací návratový kód procesu."""
+    args = build_arg_parser().parse_args(argv)
+    preset = load_preset(args.preset)
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("No input images found.", file=sys.stderr)
+        return 2
+
+    workers = args.workers or os.cpu_count()
+    print(f"Converting {len(inputs)} image(s) with {workers} worker(s)...")
+    cache = None
+    if not args.no_cache:
+        cache = ExportCache(args.cache_dir, int(args.cache_size_mb * 1024**2))
+    start = time.perf_counter()
+    results = run_batch(
+        inputs,
+        args.output_dir,
+        preset,
+        args.workers,
+        json_log=args.json_log,
+        track_memory=args.trace_memory,
+        profile_dir=args.profile_dir,
+        cache=cache,
+        output_format=args.format,
+    )
+    failed = [r for r in results if r["error"]]
+    hits = sum(1 for r in results if r["cache"] == "hit")
+    print(
+        f"Finished in {time.perf_counter() - start:.2f}s: "
+        f"{len(results) - len(failed)} ok ({hits} from cache), {len(failed)} failed."
+    )
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+# src/benchmark.py
+
+# Výkonnostní testy zpracování obrazu a generování STL na syntetických výškových mapách.
+# Každý případ běží v samostatném procesu, aby špičková paměť (peak RSS) odpovídala
+# jen danému případu. Výsledky se ukládají do JSON a lze je porovnat s uloženým
+# základem (baseline) pro odhalení regresí. Nevyžaduje displej ani tkinter.
+#
+# Použití:  python src/benchmark.py -o bench.json [--baseline old.json] [--sizes 512 8192]
+#           python src/benchmark.py --startup   (doba importu modulů ve studeném procesu)
+#           python src/benchmark.py --smoothing [--sizes 2048]   (bilateral vs. guided)
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from batch import DEFAULT_MODEL_PARAMS, DEFAULT_PROCESSING_PARAMS
+from instrumentation import Tracer
+from processing import (
+    SMOOTHING_ENGINES,
+    _stage_bilateral,
+    image_to_array,
+    process_array,
+)
+from stl_generator import DEFAULT_FEATURE_SIZE_MM, DEFAULT_MAX_DIMENSION, image_to_stl
+
+
+DEFAULT_SIZES = (512, 1024, 2048, 4096)
+
+# Kombinace parametrů: (změny parametrů zpracování, změny parametrů modelu).
+SCENARIOS = {
+    "plain": ({}, {}),
+    "threshold": ({"use_threshold": True}, {}),
+    "stroke": ({"use_threshold": True, "use_stroke": True}, {}),
+    "bilateral": (
+        {"use_artistic_smoothing": True, "artistic_smoothing_strength": 60.0},
+        {},
+    ),
+    "high_precision": ({"high_precision": True, "smoothing": 1.0}, {}),
+    "guided": (
+        {
+            "use_artistic_smoothing": True,
+            "artistic_smoothing_strength": 60.0,
+            "artistic_smoothing_engine": "guided",
+        },
+        {},
+    ),
+    "cutting_margin": ({}, {"use_cutting_margin": True}),
+    "print_detail": ({}, {"feature_size_mm": DEFAULT_FEATURE_SIZE_MM}),
+    "relief_only": ({}, {"export_relief_only": True}),
+}
+
+# Relativní zhoršení oproti základu, od kterého se výsledek hlásí jako regrese,
+# a minimální absolutní rozdíly, pod kterými se odchylky považují za šum.
+DEFAULT_TOLERANCE = 0.2
+MIN_TIME_DELTA_S = 0.05
+MIN_RSS_DELTA_MB = 10.0
+
+# Síly vyhlazení (posuvník 0-100) porovnávané při --smoothing.
+SMOOTHING_STRENGTHS = (20.0, 60.0, 100.0)
+
+# Moduly, jejichž import se měří při --startup, a cílová doba studeného startu.
+STARTUP_MODULES = ("processing", "stl_generator", "batch", "gui")
+STARTUP_BUDGET_S = 1.0
+# Těžké knihovny, které se při importu modulů nemají načítat (viz lazy importy).
+LAZY_MODULES = ("cv2",)
+
+COMPARED_METRICS = (
+    ("process_s", MIN_TIME_DELTA_S),
+    ("mesh_s", MIN_TIME_DELTA_S),
+    ("peak_rss_mb", MIN_RSS_DELTA_MB),
+)
+
+
+def synthetic_heightmap(size, seed=0):
+    """
+    Vytvoří deterministický testovací obrázek size x size: plynulé vlny,
+    ostré tvary s hranami (pro prahování a obtažení), text a jemný šum.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0.0, 8.0 * np.pi, size, dtype=np.float32)
+    waves = np.sin(x)[None, :] * np.cos(0.7 * x)[:, None]
+    arr = ((waves + 1.0) * 96.0).astype(np.uint8)
+
+    for _ in range(12):
+        cx, cy = rng.integers(0, size, 2)
+        radius = int(rng.integers(size // 40 + 1, size // 8 + 2))
+        cv2.circle(arr, (int(cx), int(cy)), radius, int(rng.integers(0, 256)), -1)
+    scale = size / 256
+    cv2.putText(
+        arr,
+        "STL",
+        (size // 8, size // 2),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        scale,
+        255,
+        max(1, int(scale * 3)),
+    )
+    noise = rng.integers(-8, 9, size=(size, size), dtype=np.int16)
+    arr = np.clip(arr.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr)
+
+
+def _peak_rss_mb():
+    # ru_maxrss je na Linuxu v kB, na macOS v bajtech.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(size, scenario, max_dimension, workdir):
+    """Změří jeden případ; běží v samostatném procesu."""
+    processing_changes, model_changes = SCENARIOS[scenario]
+    processing_params = {**DEFAULT_PROCESSING_PARAMS, **processing_changes}
+    model_params = {
+        **DEFAULT_MODEL_PARAMS,
+        "max_dimension": max_dimension,
+        # Mřížku určuje jen --max-dimension, aby byly velikosti srovnatelné.
+        "feature_size_mm": None,
+        **model_changes,
+    }
+    image = image_to_array(synthetic_heightmap(size))
+    stl_path = os.path.join(workdir, f"bench_{size}_{scenario}.stl")
+
+    tracer = Tracer()
+    start = time.perf_counter()
+    processed = process_array(image, tracer=tracer, **processing_params)
+    t_processed = time.perf_counter()
+    process_rss = _peak_rss_mb()
+    outcome = image_to_stl(processed, stl_path, model_params, lambda p: None, tracer)
+    t_meshed = time.perf_counter()
+    if outcome is not True:
+        raise RuntimeError(f"{size}/{scenario}: {outcome}")
+
+    with open(stl_path, "rb") as f:
+        f.seek(80)
+        triangles = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+    stl_bytes = os.path.getsize(stl_path)
+    os.remove(stl_path)
+
+    return {
+        "size": size,
+        "scenario": scenario,
+        "process_s": t_processed - start,
+        "mesh_s": t_meshed - t_processed,
+        "total_s": t_meshed - start,
+        "process_peak_rss_mb": process_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+        "triangles": triangles,
+        "stl_bytes": stl_bytes,
+        "stages": tracer.to_dict()["stages"],
+    }
+
+
+def run_benchmarks(sizes, scenarios, max_dimension, repeat=1, report=print):
+    """
+    Spustí všechny kombinace velikostí a scénářů, každou v novém procesu.
+    Při opakování se u časů bere minimum (nejméně zatížené měření).
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            for scenario in scenarios:
+                runs = []
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(1, mp_context=context) as pool:
+                        runs.append(
+                            pool.submit(
+                                run_case, size, scenario, max_dimension, workdir
+                            ).result()
+                        )
+                best = min(runs, key=lambda r: r["total_s"])
+                results.append(best)
+                report(
+                    f"{size:>5} {scenario:<15} process {best['process_s']:7.3f}s  "
+                    f"mesh {best['mesh_s']:7.3f}s  rss {best['peak_rss_mb']:8.1f} MB  "
+                    f"{best['triangles']:>10} tri  {best['stl_bytes'] / 1e6:9.1f} MB"
+                )
+    return results
+
+
+def measure_startup(modules=STARTUP_MODULES, repeat=3):
+    """
+    Změří dobu importu každého modulu v novém procesu interpretu (včetně startu
+    Pythonu) a zjistí, které z `LAZY_MODULES` se přitom načetly. Moduly, které
+    nelze importovat (např. GUI bez tkinteru), se přeskočí.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    code = (
+        "import sys, {0}; "
+        "print(','.join(m for m in {1!r} if m in sys.modules))"
+    )
+    results = []
+    for module in modules:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, "-c", code.format(module, LAZY_MODULES)],
+                cwd=src_dir,
+                capture_output=True,
+                text=True,
+            )
+            times.append(time.perf_counter() - start)
+            if proc.returncode != 0:
+                break
+        if proc.returncode != 0:
+            results.append({"module": module, "error": proc.stderr.strip()[-200:]})
+            continue
+        loaded = [m for m in proc.stdout.strip().split(",") if m]
+        results.append({"module": module, "import_s": min(times), "loaded": loaded})
+    return results
+
+
+def compare_smoothing(sizes, strengths=SMOOTHING_STRENGTHS, repeat=3, report=print):
+    """
+    Porovná vyhlazovací filtry zachovávající hrany na 8bitovém i float32 vstupu:
+    dobu (minimum z `repeat` běhů) a průměrnou absolutní odchylku od výsledku
+    bilaterálního filtru (na stupnici 0..255).
+    """
+    results = []
+    for size in sizes:
+        pixels = np.asarray(synthetic_heightmap(size))
+        for dtype in (np.uint8, np.float32):
+            arr = pixels.astype(dtype)
+            for strength in strengths:
+                outputs = {}
+                for engine in SMOOTHING_ENGINES:
+                    times = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        outputs[engine] = _stage_bilateral(arr, True, strength, engine)
+                        times.append(time.perf_counter() - start)
+                    reference = outputs["bilateral"].astype(np.float32)
+                    deviation = np.abs(outputs[engine] - reference).mean()
+                    result = {
+                        "size": size,
+                        "dtype": np.dtype(dtype).name,
+                        "strength": strength,
+                        "engine": engine,
+                        "time_s": min(times),
+                        "mae_vs_bilateral": float(deviation),
+                    }
+                    results.append(result)
+                    report(
+                        f"{size:>5} {result['dtype']:<8} strength {strength:5.0f} "
+                        f"{engine:<10} {result['time_s'] * 1000:8.1f} ms  "
+                        f"MAE {result['mae_vs_bilateral']:5.2f}"
+                    )
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Vrátí seznam textových popisů regresí oproti základu."""
+    reference = {(r["size"], r["scenario"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = reference.get((result["size"], result["scenario"]))
+        if base is None:
+            continue
+        for metric, min_delta in COMPARED_METRICS:
+            old, new = base[metric], result[metric]
+            if new > old * (1.0 + tolerance) and new - old > min_delta:
+                regressions.append(
+                    f"{result['size']}/{result['scenario']} {metric}: "
+                    f"{old:.3f} -> {new:.3f} (+{(new / old - 1.0) * 100:.0f}%)"
+                )
+        if result["triangles"] != base["triangles"]:
+            regressions.append(
+                f"{result['size']}/{result['scenario']} triangles: "
+                f"{base['triangles']} -> {result['triangles']}"
+            )
+    return regressions
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark image processing and STL generation (headless)."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_SIZES),
+        help="Heightmap sizes in pixels (e.g. 512 1024 8192).",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=sorted(SCENARIOS),
+        default=list(SCENARIOS),
+        help="Parameter combinations to run.",
+    )
+    parser.add_argument(
+        "--max-dimension",
+        type=int,
+        default=DEFAULT_MAX_DIMENSION,
+        help="Mesh resolution cap passed to image_to_stl (0 = full resolution).",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case.")
+    parser.add_argument(
+        "--smoothing",
+        action="store_true",
+        help="Only compare the bilateral and guided smoothing engines.",
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Only measure cold import time of the main modules.",
+    )
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare against a stored JSON result.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Relative slowdown reported as a regression (default: 0.2).",
+    )
+    return parser
+
+
+def report_startup(results, budget=STARTUP_BUDGET_S):
+    """Vypíše doby startu; vrací 1, pokud některý modul překročil cíl."""
+    slow = False
+    for r in results:
+        if "error" in r:
+            print(f"{r['module']:<15} skipped ({r['error'].splitlines()[-1]})")
+            continue
+        loaded = ", ".join(r["loaded"]) or "-"
+        print(f"{r['module']:<15} {r['import_s'] * 1000:7.0f} ms  eager: {loaded}")
+        slow = slow or r["import_s"] > budget
+    return 1 if slow else 0
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.startup:
+        return report_startup(measure_startup(repeat=max(args.repeat, 3)))
+    if args.smoothing:
+        results = compare_smoothing(args.sizes, repeat=max(args.repeat, 3))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"smoothing": results}, f, indent=2)
+        return 0
+    results = run_benchmarks(
+        args.sizes, args.scenarios, args.max_dimension, args.repeat
+    )
+    data = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "max_dimension": args.max_dimension,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
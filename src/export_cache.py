@@ -0,0 +1,119 @@
+# src/export_cache.py
+
+# Diskový cache hotových exportů. Klíčem je hash obsahu zpracovaného obrázku
+# a parametrů modelu, takže opakovaný export stejného obrázku se stejným
+# nastavením je pouhé zkopírování souboru. Při překročení celkové velikosti
+# se mažou nejdéle nepoužité položky (LRU podle času posledního přístupu).
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Výchozí umístění cache; lze změnit proměnnou prostředí STL_CONVERTER_CACHE_DIR.
+DEFAULT_CACHE_DIR = os.environ.get(
+    "STL_CONVERTER_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "stl-converter"),
+)
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024**3
+# Verze geometrie výstupu v klíči cache. Zvyšuje se při každé změně, po které
+# generátor pro stejná data a parametry vytvoří jiný soubor, aby cache
+# po aktualizaci nevracel modely ze starší verze.
+CACHE_VERSION = 4
+
+# Parametry, které nemění geometrii výsledku (jen způsob výpočtu), do klíče nepatří.
+CACHE_IGNORED_PARAMS = ("workers", "streaming", "strip_rows")
+
+
+def cache_key(source, params, suffix=".stl", mask=None):
+    """
+    Vrátí hex hash verze výstupu (`CACHE_VERSION`), obsahu zdroje, relevantních
+    parametrů, masky a typu výstupu.
+    Zdrojem je PIL obrázek, pole NumPy nebo objekt s metodou `update_digest`
+    (např. `Heightmap`).
+    """
+    relevant = {k: v for k, v in params.items() if k not in CACHE_IGNORED_PARAMS}
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"v{CACHE_VERSION}:".encode())
+    if hasattr(source, "update_digest"):
+        digest.update(f"{type(source).__name__}:".encode())
+        source.update_digest(digest)
+    elif hasattr(source, "dtype"):
+        digest.update(f"{source.dtype.str}:{source.shape}".encode())
+        # Souvislé pole se hashuje přímo přes buffer protocol, bez kopie.
+        digest.update(source if source.flags.c_contiguous else source.tobytes())
+    else:
+        digest.update(f"{source.mode}:{source.width}x{source.height}".encode())
+        digest.update(source.tobytes())
+    if mask is not None:
+        digest.update(b"mask:" + mask.tobytes())
+    digest.update(json.dumps(relevant, sort_keys=True, default=str).encode())
+    digest.update(suffix.lower().encode())
+    return digest.hexdigest()
+
+
+class ExportCache:
+    """
+    Obsahem adresovaný cache exportů v adresáři `directory` s limitem
+    `max_bytes` na celkovou velikost. Chyby souborového systému se
+    neprojeví jako chyba exportu, cache se v takovém případě jen přeskočí.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def fetch(self, key, dest_path):
+        """Při zásahu zkopíruje uložený export do `dest_path` a vrátí True."""
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, dest_path)
+            # Aktualizace času přístupu pro LRU.
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    def store(self, key, src_path):
+        """Uloží hotový export pod klíčem a případně uvolní staré položky."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Zápis přes dočasný soubor, aby souběžné procesy neviděly
+            # rozepsanou položku.
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Export cache: položku nelze uložit ({e}).")
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Smaže nejdéle nepoužité položky, dokud celková velikost překračuje limit."""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,19 +1,38 @@
 # src/gui.py
 
 # --- Standartní importy ---
+import importlib
 import threading
 import os
 import math
+import time
 import traceback
 
 # --- Importy třetích stran ---
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk, ImageOps, ImageDraw
+from PIL import Image, ImageTk
 
 # --- Vlastní moduly ---
-from processing import process_image
-from stl_generator import image_to_stl
+# Zpracování obrazu a generátor STL (NumPy, OpenCV) se importují až v metodách,
+# které je potřebují, a po zobrazení okna se načtou na pozadí (viz `_warm_up`),
+# aby okno naběhlo bez čekání na těžké knihovny.
+from export_cache import ExportCache
+from instrumentation import Tracer
+from preview_worker import PreviewWorker
+
+# Moduly načítané na pozadí po startu, v pořadí, v jakém budou potřeba.
+WARM_UP_MODULES = ("processing", "cv2", "shapes", "stl_generator")
+# Nejdelší strana zmenšeniny, ze které se počítají statistiky modelu (px).
+STATS_MAX_SIDE = 1024
+
+
+def _warm_up():
+    for name in WARM_UP_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            traceback.print_exc()
 
 
 # --- 1. KONSTRUKTOR A INICIALIZACE (__init__) ---
@@ -21,7 +40,7 @@ from stl_generator import image_to_stl
 
 
 class ReliefApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, started_at=None):
         super().__init__()
         self.title("Image to STL Converter v3.0")
         self.geometry("1200x800")
@@ -30,6 +49,17 @@ class ReliefApp(tk.Tk):
         self._initialize_variables()
         self._create_widgets()
         self._bind_events()
+        self.after_idle(self._on_started, started_at)
+
+    # Po prvním vykreslení okna zobrazí dobu startu (od `started_at`, hodnota
+    # time.perf_counter() ze spuštění) a načte těžké moduly na pozadí.
+
+    def _on_started(self, started_at):
+
+        if started_at is not None:
+            elapsed = (time.perf_counter() - started_at) * 1000
+            self.preview_stats_label.config(text=f"Startup: {elapsed:.0f} ms")
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
 
     # --- 2. SPRÁVA STAVU (_initialize_variables) ---
     # Inicializuje všechny proměnné instance a speciální Tkinter proměnné.
@@ -39,6 +69,8 @@ class ReliefApp(tk.Tk):
         """Inicializuje všechny stavové a Tkinter proměnné."""
         self.original_pil_image = None
         self.active_pil_image = None
+        # Maska (režim "L") z aplikovaných ořezů; export sestaví model jen uvnitř ní.
+        self.active_mask = None
         self.processed_pil_image = None
         self.tk_image = None
         self.current_selection_points = []
@@ -49,11 +81,47 @@ class ReliefApp(tk.Tk):
         self.pan_start_x = 0
         self.pan_start_y = 0
         self.debounce_timer = None
+        # Zpracovací pipeline podle měřítka náhledu (1.0 = plné rozlišení, "crop" = výřez).
+        self.pipelines = {}
+        self.preview_scale = 1.0
+        self.preview_origin = (0, 0)
+        self.preview_size = (0, 0)
+        self._proxy_source = None
+        self._proxy_images = {}
+        self._crop_box = None
+        self._crop_image = None
+        self._canvas_image_item = None
+        self._selection_item = None
+        self._display_source = None
+        self._display_key = None
+        self._pyramid_source = None
+        self._pyramid = []
+        self._interacting = False
+        self._interaction_timer = None
+        # Statistiky modelu se počítají až po doručení náhledu, aby ho nezdržovaly.
+        self.preview_worker = PreviewWorker(
+            self._compute_preview,
+            self._deliver_preview,
+            self._compute_model_stats,
+            self._deliver_model_stats,
+        )
+        # Maska převzorkovaná na mřížku sítě pro statistiky: (maska, mřížka, pole).
+        self._stats_mask = None
+        # Cache hotových exportů; opakovaný export se stejným nastavením je kopie souboru.
+        self.export_cache = ExportCache()
+        # Příznak zrušení běžícího exportu (threading.Event), None bez exportu.
+        self.export_cancel = None
 
         self.selection_mode = tk.StringVar(value="Rectangle")
         self.model_width_var = tk.DoubleVar(value=100.0)
         self.base_height_var = tk.DoubleVar(value=2.0)
         self.model_height_var = tk.DoubleVar(value=4.0)
+        self.max_dimension_var = tk.IntVar(value=4000)
+        # Rozlišení sítě podle velikosti detailu na výtisku (mm na vzorek).
+        self.use_feature_size_var = tk.BooleanVar(value=True)
+        self.feature_size_var = tk.DoubleVar(value=0.2)
+        self.adaptive_mesh_var = tk.BooleanVar(value=False)
+        self.max_error_var = tk.DoubleVar(value=0.05)
         self.smoothing_var = tk.DoubleVar(value=0.0)
         self.invert_colors_var = tk.BooleanVar(value=False)
         self.mirror_output_var = tk.BooleanVar(value=False)
@@ -74,6 +142,10 @@ class ReliefApp(tk.Tk):
 
         self.use_artistic_smoothing_var = tk.BooleanVar(value=False)
         self.artistic_smoothing_strength_var = tk.DoubleVar(value=0.0)
+        # "bilateral" nebo rychlý "guided" filtr (viz `processing._stage_bilateral`).
+        self.artistic_smoothing_engine_var = tk.StringVar(value="bilateral")
+        # Zpracování ve float32 místo 8 bitů (plynulé přechody bez schodů).
+        self.high_precision_var = tk.BooleanVar(value=False)
 
     # --- 3. TVORBA UŽIVATELSKÉHO ROZHRANÍ (_create_widgets) ---
     # Hlavní metoda pro sestavení a rozmístění všech hlavních komponent GUI (panely, záložky).
@@ -123,24 +195,57 @@ class ReliefApp(tk.Tk):
         self._create_entry_slider_row(
             model_frame, 2, "Relief Height (mm):", self.model_height_var, 0, 50
         )
+        self._create_entry_slider_row(
+            model_frame, 3, "Max Resolution (px):", self.max_dimension_var, 100, 10000
+        )
+        self._create_slider_row(
+            model_frame,
+            4,
+            "Print Detail (mm/sample)",
+            self.feature_size_var,
+            0.05,
+            1.0,
+            0.2,
+            self.use_feature_size_var,
+        )
+        self._create_slider_row(
+            model_frame,
+            5,
+            "Adaptive Mesh (approx. tolerance)",
+            self.max_error_var,
+            0,
+            0.5,
+            0.05,
+            self.adaptive_mesh_var,
+        )
         export_frame = ttk.LabelFrame(tab, text="Advanced Export")
         export_frame.pack(fill="x", padx=10, pady=10)
         ttk.Checkbutton(
             export_frame,
             text="Generate Flat Bottom",
             variable=self.flat_bottom_var,
+            command=self.trigger_update,
         ).pack(anchor="w", padx=5)
         ttk.Checkbutton(
             export_frame,
             text="Add Cutting Margin (1mm)",
             variable=self.use_cutting_margin_var,
+            command=self.trigger_update,
         ).pack(anchor="w", padx=5)
         ttk.Checkbutton(
             export_frame,
             text="Export as relief only (no base)",
             variable=self.export_relief_only_var,
+            command=self.trigger_update,
         ).pack(anchor="w", padx=5)
 
+        # Počet trojúhelníků, velikost a spotřeba materiálu bez exportu
+        # (viz `stl_generator.model_stats`), aktualizované s náhledem.
+        stats_frame = ttk.LabelFrame(tab, text="Model Statistics")
+        stats_frame.pack(fill="x", padx=10, pady=10)
+        self.model_stats_label = ttk.Label(stats_frame, text="", wraplength=350)
+        self.model_stats_label.pack(fill="x", padx=5)
+
         self.convert_btn = ttk.Button(
             tab,
             text="Convert to STL",
@@ -153,7 +258,19 @@ class ReliefApp(tk.Tk):
         self.progressbar = ttk.Progressbar(tab, variable=self.progress_var, maximum=100)
         self.progressbar.pack(fill="x", padx=10, pady=(0, 5))
         self.progress_label = ttk.Label(tab, text="")
-        self.progress_label.pack(fill="x", padx=10, pady=(0, 10))
+        self.progress_label.pack(fill="x", padx=10, pady=(0, 5))
+        self.cancel_btn = ttk.Button(
+            tab, text="Cancel Export", command=self.cancel_conversion, state="disabled"
+        )
+        self.cancel_btn.pack(fill="x", padx=10, pady=(0, 10))
+
+        # Stavový panel s dobou trvání jednotlivých etap (náhled a poslední export).
+        status_frame = ttk.LabelFrame(tab, text="Performance")
+        status_frame.pack(fill="x", padx=10, pady=10)
+        self.preview_stats_label = ttk.Label(status_frame, text="", wraplength=350)
+        self.preview_stats_label.pack(fill="x", padx=5)
+        self.export_stats_label = ttk.Label(status_frame, text="", wraplength=350)
+        self.export_stats_label.pack(fill="x", padx=5)
 
     # Vytváří a konfiguruje obsah záložky "Adjustments".
 
@@ -198,6 +315,14 @@ class ReliefApp(tk.Tk):
             0,
             self.use_artistic_smoothing_var,
         )
+        ttk.Checkbutton(
+            artistic_frame,
+            text="Fast mode (guided filter)",
+            variable=self.artistic_smoothing_engine_var,
+            onvalue="guided",
+            offvalue="bilateral",
+            command=self.trigger_update,
+        ).grid(row=1, column=0, columnspan=3, sticky="w", padx=5)
 
         shape_frame = ttk.LabelFrame(tab, text="Shape Operations")
         shape_frame.pack(fill="x", padx=10, pady=10, anchor="n")
@@ -244,6 +369,12 @@ class ReliefApp(tk.Tk):
             variable=self.invert_colors_var,
             command=self.trigger_update,
         ).pack(anchor="w", padx=5)
+        ttk.Checkbutton(
+            misc_frame,
+            text="High precision (16-bit+, smoother gradients)",
+            variable=self.high_precision_var,
+            command=self.trigger_update,
+        ).pack(anchor="w", padx=5)
         ttk.Checkbutton(
             misc_frame,
             text="Mirror output (for molds/stamps)",
@@ -253,6 +384,7 @@ class ReliefApp(tk.Tk):
             misc_frame,
             text="Save as Binary STL (Recommended)",
             variable=self.binary_format_var,
+            command=self.trigger_update,
         ).pack(anchor="w", padx=5)
 
     # Vytváří a konfiguruje obsah záložky "Masking Tools"
@@ -415,20 +547,18 @@ class ReliefApp(tk.Tk):
 
     def load_image(self):
         path = filedialog.askopenfilename(
-            filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif")]
+            filetypes=[
+                ("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif;*.tif;*.tiff")
+            ]
         )
         if not path:
             return
+        from processing import load_image_file
+
         try:
-            with Image.open(path) as img:
-                img = ImageOps.exif_transpose(img)
-                if img.mode == "RGBA":
-                    bg = Image.new("RGB", img.size, (255, 255, 255))
-                    bg.paste(img, mask=img.split()[3])
-                    self.original_pil_image = bg
-                else:
-                    self.original_pil_image = img.copy()
+            self.original_pil_image = load_image_file(path)
             self.active_pil_image = self.original_pil_image.copy()
+            self.active_mask = None
             self.revert_mask_btn.config(state="disabled")
             self.file_label.config(text=os.path.basename(path))
             self.convert_btn.config(state="normal")
@@ -444,38 +574,279 @@ class ReliefApp(tk.Tk):
     def trigger_update(self, *args):
         if self.debounce_timer:
             self.after_cancel(self.debounce_timer)
-        self.debounce_timer = self.after(150, self.update_and_redraw)
+        # Výpočet běží na pozadí, proto stačí krátké zpoždění pro sloučení událostí.
+        self.debounce_timer = self.after(30, self.update_and_redraw)
 
     # Hlavní metoda pro aktualizaci. Sesbírá aktuální hodnoty ze všech ovládacích prvků
-    # Zavolá externí funkci 'process_image' pro přepočet náhledu.
+    # Předá je zpracovací pipeline (viz 'ProcessingPipeline') pro přepočet náhledu.
 
     def update_and_redraw(self):
+        from processing import processing_halo
+
         if not self.active_pil_image:
             return
-        self.processed_pil_image = process_image(
-            self.active_pil_image,
-            self.contrast_var.get(),
-            self.brightness_var.get(),
-            self.smoothing_var.get(),
-            self.invert_colors_var.get(),
-            self.use_threshold_var.get(),
-            self.threshold_level_var.get(),
-            self.dilate_var.get(),
-            self.erode_var.get(),
-            self.noise_reduction_var.get(),
-            self.use_stroke_var.get(),
-            self.stroke_thickness_var.get(),
-            self.use_artistic_smoothing_var.get(),
-            self.artistic_smoothing_strength_var.get(),
+        params = self.get_processing_params_as_dict()
+        scale = self._preview_scale()
+        box = None
+        if scale >= 1.0:
+            box = self._get_preview_crop_box(processing_halo(params))
+        # Samotný výpočet proběhne ve vedlejším vlákně, hlavní vlákno zůstává volné pro UI.
+        # Novější úloha zruší rozpracovanou a výsledek starší generace se zahodí.
+        self.preview_worker.submit(
+            {
+                "source": self.active_pil_image,
+                "params": params,
+                "scale": scale,
+                "box": box,
+                "mask": self.active_mask,
+                "model_params": self.get_params_as_dict(),
+            }
         )
+
+    # Výpočet náhledu. Běží ve vlákně 'PreviewWorker', proto nesmí sahat na widgety;
+    # zmenšené kopie, výřez a pipeline používá výhradně toto vlákno.
+
+    def _compute_preview(self, job, is_stale):
+
+        from processing import ProcessingPipeline, scale_processing_params
+
+        source_image, params, scale, box = (
+            job["source"],
+            job["params"],
+            job["scale"],
+            job["box"],
+        )
+        self._sync_preview_source(source_image)
+        if scale < 1.0:
+            # Oddálený pohled: zpracuje se zmenšená kopie se zmenšenými jádry filtrů.
+            key, source, origin = scale, self._get_proxy_image(scale), (0, 0)
+            params = scale_processing_params(params, scale)
+        elif box is None:
+            key, source, origin = 1.0, source_image, (0, 0)
+        else:
+            # Přiblížený pohled: zpracuje se jen viditelný výřez (s okrajem) v plném rozlišení.
+            key, source, origin = "crop", self._get_crop_image(box), box[:2]
+
+        # Pipeline si pamatuje mezivýsledky etap, takže se přepočítají jen etapy
+        # od první změněné hodnoty dál.
+        pipeline = self.pipelines.setdefault(key, ProcessingPipeline())
+        tracer = Tracer()
+        processed = pipeline.run(
+            source, cancel_check=is_stale, tracer=tracer, **params
+        )
+        return (
+            processed,
+            scale,
+            origin,
+            source.size,
+            tracer.summary("process."),
+        )
+
+    # Statistiky modelu pro celý obrázek bez ohledu na aktuální pohled. Zpracuje
+    # se zmenšenina (mocnina dvou, nejvýše STATS_MAX_SIDE px) se stejnou pipeline
+    # jako oddálený náhled, takže změna parametrů modelu nic nepřepočítává.
+    # Běží ve vlákně 'PreviewWorker' jako méně naléhavý krok po náhledu.
+
+    def _compute_model_stats(self, job, is_stale):
+
+        from processing import ProcessingPipeline, scale_processing_params
+        from stl_generator import mesh_grid_size, model_stats
+
+        source_image = job["source"]
+        longest = max(source_image.size)
+        scale = min(1.0, 2.0 ** math.floor(math.log2(STATS_MAX_SIDE / longest)))
+        source = source_image if scale == 1.0 else self._get_proxy_image(scale)
+        pipeline = self.pipelines.setdefault(scale, ProcessingPipeline())
+        processed = pipeline.run(
+            source,
+            cancel_check=is_stale,
+            **scale_processing_params(job["params"], scale),
+        )
+        mask = job["mask"]
+        if mask is not None and scale != 1.0:
+            grid = mesh_grid_size(*source_image.size, job["model_params"])
+            mask = self._get_stats_mask(mask, grid)
+        try:
+            return model_stats(
+                processed,
+                job["model_params"],
+                mask=mask,
+                source_size=None if scale == 1.0 else source_image.size,
+            )
+        except ValueError as e:
+            return str(e)
+
+    # Převzorkování masky v plném rozlišení na mřížku sítě trvá u velkých masek
+    # stovky ms, proto se výsledek pamatuje, dokud se maska ani mřížka nezmění.
+
+    def _get_stats_mask(self, mask, grid):
+
+        from stl_generator import grid_mask
+
+        cached = self._stats_mask
+        if cached is None or cached[0] is not mask or cached[1] != grid:
+            self._stats_mask = (mask, grid, grid_mask(mask, grid))
+        return self._stats_mask[2]
+
+    def _deliver_preview(self, generation, result):
+
+        self.after(0, self._apply_preview, generation, result)
+
+    def _deliver_model_stats(self, generation, model):
+
+        self.after(0, self._apply_model_stats, generation, model)
+
+    def _apply_preview(self, generation, result):
+
+        if not self.preview_worker.is_current(generation):
+            return
+        (
+            self.processed_pil_image,
+            self.preview_scale,
+            self.preview_origin,
+            self.preview_size,
+            stats,
+        ) = result
+        self.preview_stats_label.config(text=f"Preview: {stats}")
         self.redraw_canvas()
 
+    def _apply_model_stats(self, generation, model):
+
+        if not self.preview_worker.is_current(generation):
+            return
+        self.model_stats_label.config(text=self._format_model_stats(model))
+
+    # Text statistik modelu (slovník z `model_stats`, nebo text chyby).
+
+    def _format_model_stats(self, model):
+
+        if isinstance(model, str):
+            return model
+        width, height = model["grid"]
+        triangles = f"{model['triangles']:,} triangles"
+        size = f"STL {model['stl_bytes'] / 1024**2:.1f} MB"
+        if not model["triangles_exact"]:
+            triangles, size = f"≤ {triangles}", f"≤ {size}"
+        lines = [f"Mesh {width} × {height} · {triangles} · {size}"]
+        if model["volume_mm3"] is None:
+            lines.append("Relief only: no volume.")
+        else:
+            lines.append(
+                f"Volume {model['volume_mm3'] / 1000:.1f} cm³ · "
+                f"~{model['filament_g']:.0f} g PLA at 100% infill"
+            )
+        return "\n".join(lines)
+
+    # Měřítko náhledu podle zoomu: mocniny dvou, aby se náhled nepřepočítával
+    # při každém kroku kolečka myši. Od zoomu 1:1 výše se zpracovává plné rozlišení.
+
+    def _preview_scale(self):
+
+        if self.zoom_level >= 1.0:
+            return 1.0
+        return 2.0 ** math.ceil(math.log2(self.zoom_level))
+
+    def _sync_preview_source(self, source_image):
+
+        # Zmenšené kopie, výřez a pipeline se uchovávají, dokud se nezmění
+        # aktivní obrázek (aplikace masky, nové načtení).
+        if self._proxy_source is not source_image:
+            self._proxy_source = source_image
+            self._proxy_images = {}
+            self._crop_box = None
+            self._crop_image = None
+            self.pipelines = {}
+
+    def _get_proxy_image(self, scale):
+
+        if scale not in self._proxy_images:
+            w, h = self._proxy_source.size
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            self._proxy_images[scale] = self._proxy_source.resize(
+                size, Image.Resampling.BOX
+            )
+        return self._proxy_images[scale]
+
+    def _get_crop_image(self, box):
+
+        # Stejný výřez vrací stejný objekt, aby pipeline mohla využít uložené etapy.
+        if box != self._crop_box:
+            self._crop_box = box
+            self._crop_image = self._proxy_source.crop(box)
+        return self._crop_image
+
+    def _get_preview_crop_box(self, halo):
+
+        # Vrací výřez (v pixelech obrázku) pokrývající viditelnou oblast s rezervou pro posun
+        # a okrajem pro filtry, nebo None, pokud by výřez pokryl většinu obrázku.
+        # Začátek výřezu je zarovnaný na mřížku podvzorkování guided filtru,
+        # aby výřez dával stejný výsledek jako celý obrázek (v přesném režimu
+        # až na zaokrouhlení float32).
+        from processing import GUIDED_SUBSAMPLE
+
+        img_w, img_h = self.active_pil_image.size
+        x1, y1, x2, y2 = self._visible_image_box()
+        margin_x = (x2 - x1) // 2 + halo
+        margin_y = (y2 - y1) // 2 + halo
+        align = GUIDED_SUBSAMPLE
+        box = (
+            max(0, x1 - margin_x) // align * align,
+            max(0, y1 - margin_y) // align * align,
+            min(img_w, x2 + margin_x),
+            min(img_h, y2 + margin_y),
+        )
+        if box[2] <= box[0] or box[3] <= box[1]:
+            return None
+        if (box[2] - box[0]) * (box[3] - box[1]) > 0.5 * img_w * img_h:
+            return None
+        return box
+
+    def _visible_image_box(self):
+
+        canvas_w, canvas_h = (
+            self.preview_canvas.winfo_width(),
+            self.preview_canvas.winfo_height(),
+        )
+        return (
+            int(self.view_offset_x),
+            int(self.view_offset_y),
+            int(self.view_offset_x + canvas_w / self.zoom_level),
+            int(self.view_offset_y + canvas_h / self.zoom_level),
+        )
+
+    # Po změně zoomu nebo posunu naplánuje přepočet, pokud aktuální náhled
+    # nemá vhodné rozlišení nebo nepokrývá viditelnou oblast.
+
+    def _refresh_preview_if_needed(self):
+
+        if not self.active_pil_image:
+            return
+        if self._preview_scale() != self.preview_scale:
+            self.trigger_update()
+            return
+        if self.preview_scale < 1.0 or self.preview_size == self.active_pil_image.size:
+            return
+        x1, y1, x2, y2 = self._visible_image_box()
+        ox, oy = self.preview_origin
+        pw, ph = self.preview_size
+        img_w, img_h = self.active_pil_image.size
+        if (
+            max(x1, 0) < ox
+            or max(y1, 0) < oy
+            or min(x2, img_w) > ox + pw
+            or min(y2, img_h) > oy + ph
+        ):
+            self.trigger_update()
+
     # Překreslí obsah plátna na základě aktuálně zpracovaného obrázku ('self.processed_pil_image').
 
     def redraw_canvas(self):
 
         if not self.processed_pil_image:
             self.preview_canvas.delete("all")
+            self._canvas_image_item = None
+            self._selection_item = None
+            self._display_key = None
             return
         canvas_w, canvas_h = (
             self.preview_canvas.winfo_width(),
@@ -484,32 +855,136 @@ class ReliefApp(tk.Tk):
         if canvas_w < 2 or canvas_h < 2:
             return
 
-        visible_img_x1 = int(self.view_offset_x)
-        visible_img_y1 = int(self.view_offset_y)
-        visible_img_x2 = int(self.view_offset_x + canvas_w / self.zoom_level)
-        visible_img_y2 = int(self.view_offset_y + canvas_h / self.zoom_level)
         try:
-            cropped_img = self.processed_pil_image.crop(
-                (visible_img_x1, visible_img_y1, visible_img_x2, visible_img_y2)
-            )
-            display_img = cropped_img.resize(
-                (canvas_w, canvas_h), Image.Resampling.LANCZOS
-            )
-            self.tk_image = ImageTk.PhotoImage(display_img)
-            self.preview_canvas.delete("all")
-            self.preview_canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
+            self._render_preview_image(canvas_w, canvas_h)
         except Exception:
             pass
+        self._draw_selection()
 
-        if self.current_selection_points:
-            image_points = self._get_final_shape_points()
-            if len(image_points) > 1:
-                canvas_points_to_draw = [
-                    self.image_to_canvas_coords(x, y) for x, y in image_points
-                ]
-                self.preview_canvas.create_polygon(
-                    canvas_points_to_draw, outline="cyan", fill="", width=2
-                )
+    # Vykreslí viditelnou část náhledu do jediné (opakovaně používané) položky plátna.
+    # Pokud se od posledního vykreslení nezměnil obrázek ani pohled, nedělá nic,
+    # takže např. kreslení tvaru masky nepřepočítává obraz.
+
+    def _render_preview_image(self, canvas_w, canvas_h):
+
+        # Během posouvání/zoomu se použije rychlé převzorkování, po zastavení LANCZOS.
+        resample = (
+            Image.Resampling.BILINEAR if self._interacting else Image.Resampling.LANCZOS
+        )
+        key = (
+            self.view_offset_x,
+            self.view_offset_y,
+            self.zoom_level,
+            canvas_w,
+            canvas_h,
+            resample,
+        )
+        if (
+            self._display_source is self.processed_pil_image
+            and key == self._display_key
+        ):
+            return
+
+        # Viditelná oblast v souřadnicích obrázku se převede do souřadnic náhledu,
+        # který může být zmenšený (proxy) nebo jen výřezem obrázku, a do vhodné
+        # úrovně pyramidy, aby se nezmenšovalo víc než dvojnásobně.
+        level_img, level_scale = self._get_pyramid_level(
+            self.zoom_level / self.preview_scale
+        )
+        scale = self.preview_scale * level_scale
+        ox, oy = self.preview_origin
+        visible_img_x1 = int((self.view_offset_x - ox) * scale)
+        visible_img_y1 = int((self.view_offset_y - oy) * scale)
+        visible_img_x2 = int(
+            (self.view_offset_x + canvas_w / self.zoom_level - ox) * scale
+        )
+        visible_img_y2 = int(
+            (self.view_offset_y + canvas_h / self.zoom_level - oy) * scale
+        )
+        cropped_img = level_img.crop(
+            (visible_img_x1, visible_img_y1, visible_img_x2, visible_img_y2)
+        )
+        display_img = cropped_img.resize((canvas_w, canvas_h), resample)
+
+        # Stávající PhotoImage i položka plátna se znovu použijí, pokud sedí rozměry.
+        if self.tk_image is not None and (
+            self.tk_image.width(),
+            self.tk_image.height(),
+        ) == (canvas_w, canvas_h):
+            self.tk_image.paste(display_img)
+        else:
+            self.tk_image = ImageTk.PhotoImage(display_img)
+        if self._canvas_image_item is None:
+            self._canvas_image_item = self.preview_canvas.create_image(
+                0, 0, anchor="nw", image=self.tk_image
+            )
+        else:
+            self.preview_canvas.itemconfigure(
+                self._canvas_image_item, image=self.tk_image
+            )
+        self.preview_canvas.tag_lower(self._canvas_image_item)
+        self._display_source = self.processed_pil_image
+        self._display_key = key
+
+    # Vrací úroveň pyramidy (zmenšenin náhledu po polovinách) vhodnou pro dané
+    # zvětšení a její měřítko vůči zpracovanému náhledu. Pyramida se zneplatní
+    # při každé změně zpracovaného obrázku.
+
+    def _get_pyramid_level(self, display_scale):
+
+        if self._pyramid_source is not self.processed_pil_image:
+            self._pyramid_source = self.processed_pil_image
+            # Přesný režim vrací obrázek "F"; displej stačí 8bitový.
+            base = self.processed_pil_image
+            self._pyramid = [base if base.mode == "L" else base.convert("L")]
+        base_w = self._pyramid[0].width
+        level = 0
+        level_scale = 1.0
+        while display_scale <= level_scale / 2 and min(self._pyramid[level].size) > 1:
+            level += 1
+            if level == len(self._pyramid):
+                self._pyramid.append(self._pyramid[-1].reduce(2))
+            level_scale = self._pyramid[level].width / base_w
+        return self._pyramid[level], level_scale
+
+    def _draw_selection(self):
+
+        from shapes import to_canvas
+
+        image_points = (
+            self._get_final_shape_points() if self.current_selection_points else []
+        )
+        if len(image_points) < 2:
+            if self._selection_item is not None:
+                self.preview_canvas.delete(self._selection_item)
+                self._selection_item = None
+            return
+        canvas_points_to_draw = to_canvas(
+            image_points, self.view_offset_x, self.view_offset_y, self.zoom_level
+        )
+        if self._selection_item is None:
+            self._selection_item = self.preview_canvas.create_polygon(
+                canvas_points_to_draw, outline="cyan", fill="", width=2
+            )
+        else:
+            self.preview_canvas.coords(self._selection_item, canvas_points_to_draw)
+            self.preview_canvas.tag_raise(self._selection_item)
+
+    # Označí probíhající posun/zoom; po krátké nečinnosti se náhled překreslí
+    # v plné kvalitě.
+
+    def _begin_interaction(self):
+
+        self._interacting = True
+        if self._interaction_timer:
+            self.after_cancel(self._interaction_timer)
+        self._interaction_timer = self.after(150, self._end_interaction)
+
+    def _end_interaction(self):
+
+        self._interaction_timer = None
+        self._interacting = False
+        self.redraw_canvas()
 
     # Inicializuje proces konverze na STL v samostatném, neblokujícím vlákně.
 
@@ -520,20 +995,62 @@ class ReliefApp(tk.Tk):
                 "Missing Image", "Please load and process an image first."
             )
             return
+        # Formát výstupu určuje přípona souboru (viz `mesh_writer.mesh_format`).
         stl_path = filedialog.asksaveasfilename(
-            defaultextension=".stl", filetypes=[("STL Files", "*.stl")]
+            defaultextension=".stl",
+            filetypes=[
+                ("STL Files", "*.stl"),
+                ("Compressed STL", "*.stl.gz"),
+                ("3MF Files", "*.3mf"),
+                ("PLY Files", "*.ply"),
+            ],
         )
         if not stl_path:
             return
         self.convert_btn.config(state="disabled")
+        self.cancel_btn.config(state="normal")
+        self.progress_var.set(0)
+        self.progress_label.config(text="Processing image...")
+        self.export_cancel = threading.Event()
         params = self.get_params_as_dict()
+        # Náhled může být zmenšený nebo oříznutý, export proto zpracuje obrázek
+        # znovu v plném rozlišení (ve vedlejším vlákně).
         thread = threading.Thread(
             target=self.run_conversion_thread,
-            args=(self.processed_pil_image, stl_path, params),
+            args=(
+                self.active_pil_image,
+                self.active_mask,
+                self.get_processing_params_as_dict(),
+                stl_path,
+                params,
+                self.export_cancel,
+            ),
         )
         thread.daemon = True
         thread.start()
 
+    # Vrací slovník s aktuálními parametry zpracování obrazu (klíče odpovídají 'process_image').
+
+    def get_processing_params_as_dict(self):
+
+        return {
+            "contrast": self.contrast_var.get(),
+            "brightness": self.brightness_var.get(),
+            "smoothing": self.smoothing_var.get(),
+            "invert_colors": self.invert_colors_var.get(),
+            "use_threshold": self.use_threshold_var.get(),
+            "threshold_level": self.threshold_level_var.get(),
+            "dilate": self.dilate_var.get(),
+            "erode": self.erode_var.get(),
+            "noise_reduction": self.noise_reduction_var.get(),
+            "use_stroke": self.use_stroke_var.get(),
+            "stroke_thickness": self.stroke_thickness_var.get(),
+            "use_artistic_smoothing": self.use_artistic_smoothing_var.get(),
+            "artistic_smoothing_strength": self.artistic_smoothing_strength_var.get(),
+            "artistic_smoothing_engine": self.artistic_smoothing_engine_var.get(),
+            "high_precision": self.high_precision_var.get(),
+        }
+
     # Vrací slovník s aktuálními parametry z GUI pro předání do STL generátoru.
 
     def get_params_as_dict(self):
@@ -542,6 +1059,13 @@ class ReliefApp(tk.Tk):
             "model_width_mm": self.model_width_var.get(),
             "base_height": self.base_height_var.get(),
             "model_height": self.model_height_var.get(),
+            "max_dimension": self.max_dimension_var.get(),
+            "feature_size_mm": (
+                self.feature_size_var.get() if self.use_feature_size_var.get() else None
+            ),
+            "max_error_mm": (
+                self.max_error_var.get() if self.adaptive_mesh_var.get() else None
+            ),
             "mirror_output": self.mirror_output_var.get(),
             "is_binary": self.binary_format_var.get(),
             "use_cutting_margin": self.use_cutting_margin_var.get(),
@@ -550,18 +1074,67 @@ class ReliefApp(tk.Tk):
         }
 
     # Metoda běžící ve vedlejším vlákně. Volá 'image_to_stl' a plánuje dokončení v hlavním vlákně.
+    # Nastavení příznaku `cancel` přeruší zpracování i generování mezi dávkami práce.
 
-    def run_conversion_thread(self, processed_image, stl_path, params):
+    def run_conversion_thread(
+        self, source_image, mask, processing_params, stl_path, params, cancel
+    ):
+
+        from processing import ProcessingCancelled, image_to_array, process_array
+        from stl_generator import image_to_stl
+
+        update_ui = lambda p, eta: self.after(0, self._update_progress_ui, p, eta)
+        tracer = Tracer()
+        try:
+            # Export předává generátoru přímo pole NumPy, bez převodu na PIL.
+            processed_image = process_array(
+                image_to_array(source_image),
+                tracer=tracer,
+                cancel_check=cancel.is_set,
+                **processing_params,
+            )
+        except ProcessingCancelled as e:
+            result = e
+        # Chyba zpracování se předá do chybového dialogu jako u `image_to_stl`.
+        except Exception as e:
+            traceback.print_exc()
+            result = e
+        else:
+            # Generátor vytvoří síť jen uvnitř masky se stěnami po obrysu.
+            result = image_to_stl(
+                processed_image,
+                stl_path,
+                params,
+                update_ui,
+                tracer,
+                self.export_cache,
+                mask=mask,
+                cancel_check=cancel.is_set,
+            )
+        self.after(0, self.finish_conversion, result, stl_path, tracer.summary())
+
+    # Požádá běžící export o zrušení; vlákno skončí po dokončení aktuální dávky.
 
-        update_ui = lambda p: self.after(0, self._update_progress_ui, p)
-        result = image_to_stl(processed_image, stl_path, params, update_ui)
-        self.after(0, self.finish_conversion, result, stl_path)
+    def cancel_conversion(self):
+
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            self.cancel_btn.config(state="disabled")
+            self.progress_label.config(text="Cancelling...")
 
     # Zpracuje výsledek konverze z vedlejšího vlákna a zobrazí úspěch nebo chybu.
 
-    def finish_conversion(self, result, stl_path):
+    def finish_conversion(self, result, stl_path, stats=""):
+
+        from processing import ProcessingCancelled
 
-        if result is True:
+        self.export_cancel = None
+        self.cancel_btn.config(state="disabled")
+        self.export_stats_label.config(text=f"Export: {stats}")
+        if isinstance(result, ProcessingCancelled):
+            self.progress_label.config(text="Export cancelled.")
+            self.progress_var.set(0)
+        elif result is True:
             self.progress_label.config(text="Done!")
             messagebox.showinfo("Success", f"Model successfully saved to:\n{stl_path}")
         else:
@@ -576,10 +1149,18 @@ class ReliefApp(tk.Tk):
     # Sada menších, specializovaných funkcí pro specifické úkoly,
     # Aktualizace progress baru, přepočty souřadnic a logika pro práci s maskou.
 
-    def _update_progress_ui(self, percentage):
+    def _update_progress_ui(self, percentage, eta=None):
 
+        # Po zrušení se už průběh nepřepisuje přes "Cancelling...".
+        if self.export_cancel is None or self.export_cancel.is_set():
+            return
         self.progress_var.set(percentage)
-        self.progress_label.config(text=f"{percentage:.0f}%")
+        text = f"{percentage:.0f}%"
+        if eta is not None and percentage < 100:
+            minutes, seconds = divmod(math.ceil(eta), 60)
+            remaining = f"{minutes} min {seconds:02d} s" if minutes else f"{seconds} s"
+            text += f" · about {remaining} left"
+        self.progress_label.config(text=text)
 
     def on_mouse_wheel(self, event):
 
@@ -591,7 +1172,9 @@ class ReliefApp(tk.Tk):
         self.zoom_level = max(0.1, min(self.zoom_level, 20))
         self.view_offset_x = img_x - (event.x / self.zoom_level)
         self.view_offset_y = img_y - (event.y / self.zoom_level)
+        self._begin_interaction()
         self.redraw_canvas()
+        self._refresh_preview_if_needed()
 
     def on_pan_start(self, event):
         self.pan_start_x = event.x
@@ -607,7 +1190,9 @@ class ReliefApp(tk.Tk):
         self.view_offset_y -= dy
         self.pan_start_x = event.x
         self.pan_start_y = event.y
+        self._begin_interaction()
         self.redraw_canvas()
+        self._refresh_preview_if_needed()
 
     def reset_view(self):
 
@@ -625,6 +1210,7 @@ class ReliefApp(tk.Tk):
                 self.view_offset_x = (img_w - canvas_w / self.zoom_level) / 2
                 self.view_offset_y = (img_h - canvas_h / self.zoom_level) / 2
         self.redraw_canvas()
+        self._refresh_preview_if_needed()
 
     def canvas_to_image_coords(self, canvas_x, canvas_y):
 
@@ -685,6 +1271,9 @@ class ReliefApp(tk.Tk):
 
     def apply_mask(self):
 
+        import numpy as np
+        from shapes import rasterize_mask
+
         if not self.active_pil_image:
             return
         if len(self.current_selection_points) < 2:
@@ -692,14 +1281,21 @@ class ReliefApp(tk.Tk):
         image_points = self._get_final_shape_points()
         if len(image_points) < 3:
             return
-        mask = Image.new("L", self.active_pil_image.size, 0)
-        draw = ImageDraw.Draw(mask)
-        draw.polygon(image_points, fill=255)
-        if self.invert_polygon_var.get():
-            mask = ImageOps.invert(mask)
-        img_gray = self.active_pil_image.copy().convert("L")
-        black_bg = Image.new("L", self.active_pil_image.size, 0)
-        self.active_pil_image = Image.composite(img_gray, black_bg, mask)
+        mask = rasterize_mask(
+            image_points, self.active_pil_image.size, self.invert_polygon_var.get()
+        )
+        # Opakované ořezy se kombinují (průnik masek).
+        if self.active_mask is not None:
+            np.minimum(mask, np.asarray(self.active_mask), out=mask)
+        self.active_mask = Image.fromarray(mask)
+        # Pixely mimo masku se vynulují přímo v poli; obrázek s vyšší bitovou
+        # hloubkou (režim "F") si přesnost ponechá.
+        image = self.active_pil_image
+        if image.mode not in ("L", "F"):
+            image = image.convert("L")
+        pixels = np.array(image)
+        pixels[mask == 0] = 0
+        self.active_pil_image = Image.fromarray(pixels)
         self.revert_mask_btn.config(state="normal")
         self.clear_current_selection()
         self.trigger_update()
@@ -709,52 +1305,17 @@ class ReliefApp(tk.Tk):
         if not self.original_pil_image:
             return
         self.active_pil_image = self.original_pil_image.copy()
+        self.active_mask = None
         self.revert_mask_btn.config(state="disabled")
         self.trigger_update()
 
     def _get_final_shape_points(self):
 
-        mode = self.selection_mode.get()
-        points = self.current_selection_points
-        if not points:
+        from shapes import shape_points
+
+        if not self.current_selection_points:
             return []
-        if mode == "Rectangle" and len(points) >= 2:
-            x1, y1 = points[0]
-            x2, y2 = points[-1]
-            return [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
-        if mode in ["Hexagon", "Heart"] and len(points) >= 2:
-            center_x, center_y = points[0]
-            edge_x, edge_y = points[-1]
-            dx, dy = edge_x - center_x, edge_y - center_y
-            radius, angle_offset = math.sqrt(dx**2 + dy**2), math.atan2(dy, dx)
-            final_points = []
-            if mode == "Hexagon" and radius > 0:
-                for i in range(6):
-                    angle = (math.pi / 3 * i) + angle_offset
-                    final_points.append(
-                        (
-                            center_x + radius * math.cos(angle),
-                            center_y + radius * math.sin(angle),
-                        )
-                    )
-            elif mode == "Heart" and radius > 0:
-                for i in range(100):
-                    t = 2 * math.pi * i / 100
-                    x = center_x + radius * (16 * math.sin(t) ** 3) / 13
-                    y = (
-                        center_y
-                        - radius
-                        * (
-                            13 * math.cos(t)
-                            - 5 * math.cos(2 * t)
-                            - 2 * math.cos(3 * t)
-                            - math.cos(4 * t)
-                        )
-                        / 13
-                    )
-                    final_points.append((x, y))
-            return final_points
-        return points
+        return shape_points(self.selection_mode.get(), self.current_selection_points)
 
     def undo_last_point(self):
 
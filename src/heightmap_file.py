@@ -0,0 +1,146 @@
+# src/heightmap_file.py
+
+# Kompaktní kontejner výškové mapy (.hmap) pro předávání mezi zpracováním obrazu
+# a generováním sítě na různých strojích. Soubor obsahuje JSON hlavičku s parametry
+# modelu a surové pole výšek (uint16 nebo float16), které se načítá přes np.memmap,
+# takže generátor nemusí dekódovat PNG ani používat PIL a obrovské mapy čte po pásech.
+#
+# Rozložení souboru: b"HMAP", uint32 (LE) délka hlavičky, JSON hlavička, výplň
+# na násobek 64 bajtů, data (řádky x sloupce, C pořadí, little endian)
+# a volitelně maska jako bitové pole (np.packbits, 1 = uvnitř).
+
+import json
+import struct
+
+import numpy as np
+
+HEIGHTMAP_MAGIC = b"HMAP"
+HEIGHTMAP_VERSION = 1
+HEIGHTMAP_EXTENSION = ".hmap"
+HEIGHTMAP_DTYPES = {"uint16": "<u2", "float16": "<f2"}
+# Parametry modelu uložené v hlavičce; při generování mají přednost před předanými.
+HEIGHTMAP_PARAMS = (
+    "model_width_mm",
+    "base_height",
+    "model_height",
+    "mirror_output",
+    "use_cutting_margin",
+)
+_ALIGNMENT = 64
+
+
+def heightmap_from_image(pil_image):
+    """
+    Převede zpracovaný obrázek (režim "L" nebo "F" ve stupnici 0..255, případně
+    "LA" s maskou v alfa kanálu, nebo 2D pole z `process_array`) na relativní
+    výšky 0..1 (1 = nejvyšší bod, tedy černá) a masku nebo None.
+    """
+    inside = None
+    if isinstance(pil_image, np.ndarray):
+        return 1.0 - pil_image.astype(np.float32) / 255.0, inside
+    if pil_image.mode == "LA":
+        inside = np.asarray(pil_image.getchannel("A")) >= 128
+        pil_image = pil_image.getchannel("L")
+    if pil_image.mode != "F":
+        pil_image = pil_image.convert("L")
+    pixels = np.asarray(pil_image, dtype=np.float32)
+    return 1.0 - pixels / 255.0, inside
+
+
+def save_heightmap(path, heights, params, inside=None, dtype="uint16"):
+    """
+    Uloží relativní výšky 0..1 (řádky, sloupce) do souboru .hmap. Z `params`
+    se uloží jen klíče `HEIGHTMAP_PARAMS`; `inside` je volitelná maska pixelů.
+    """
+    heights = np.asarray(heights, dtype=np.float32)
+    if dtype == "uint16":
+        data = np.rint(np.clip(heights, 0.0, 1.0) * 65535.0).astype("<u2")
+    elif dtype == "float16":
+        data = np.clip(heights, 0.0, 1.0).astype("<f2")
+    else:
+        raise ValueError(f"Nepodporovaný typ výšek: {dtype}")
+
+    header = {
+        "version": HEIGHTMAP_VERSION,
+        "dtype": dtype,
+        "shape": list(heights.shape),
+        "params": {k: params[k] for k in HEIGHTMAP_PARAMS if k in params},
+        "data_offset": 0,
+        "mask_offset": None,
+    }
+    # Posun dat závisí na délce hlavičky, proto se hlavička sestaví dvakrát.
+    for _ in range(2):
+        encoded = json.dumps(header).encode("utf-8")
+        start = len(HEIGHTMAP_MAGIC) + 4 + len(encoded)
+        header["data_offset"] = -(-start // _ALIGNMENT) * _ALIGNMENT + _ALIGNMENT
+        if inside is not None:
+            header["mask_offset"] = header["data_offset"] + data.nbytes
+    encoded = json.dumps(header).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(HEIGHTMAP_MAGIC)
+        f.write(struct.pack("<I", len(encoded)))
+        f.write(encoded)
+        f.write(b"\0" * (header["data_offset"] - f.tell()))
+        data.tofile(f)
+        if inside is not None:
+            np.packbits(np.asarray(inside, dtype=bool), axis=None).tofile(f)
+
+
+class Heightmap:
+    """
+    Načtená výšková mapa. `data` je np.memmap jen pro čtení (bez kopie do paměti),
+    `params` parametry modelu z hlavičky. Relativní výška 0..1 je `data * scale`;
+    na float32 se převádí až po řádcích při generování sítě.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(HEIGHTMAP_MAGIC)) != HEIGHTMAP_MAGIC:
+                raise ValueError(f"Soubor {path} není výšková mapa (.hmap).")
+            (length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(length).decode("utf-8"))
+        version = header.get("version")
+        if version != HEIGHTMAP_VERSION:
+            raise ValueError(f"Nepodporovaná verze výškové mapy: {version}")
+
+        self.header = header
+        self.params = header["params"]
+        self.dtype = header["dtype"]
+        self.shape = tuple(header["shape"])
+        self.scale = 1.0 / 65535.0 if self.dtype == "uint16" else 1.0
+        self.data = np.memmap(
+            path,
+            dtype=HEIGHTMAP_DTYPES[self.dtype],
+            mode="r",
+            offset=header["data_offset"],
+            shape=self.shape,
+        )
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+    def inside(self):
+        """Maska pixelů (bool pole) nebo None, pokud soubor masku neobsahuje."""
+        offset = self.header.get("mask_offset")
+        if offset is None:
+            return None
+        count = self.shape[0] * self.shape[1]
+        bits = np.memmap(self.path, dtype=np.uint8, mode="r", offset=offset)
+        return np.unpackbits(bits, count=count).astype(bool).reshape(self.shape)
+
+    def update_digest(self, digest):
+        """Přidá obsah souboru do hashe (klíč cache exportů) po blocích."""
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+
+def load_heightmap(path):
+    return Heightmap(path)
@@ -0,0 +1,495 @@
+import numpy as np
+
+
+# Modul pro přímou konstrukci trojúhelníkové sítě z výškové mapy pouze pomocí NumPy.
+# Výstupem jsou vždy dvě pole: vrcholy (N, 3) float32 a trojúhelníky (M, 3) int32.
+# Všechny trojúhelníky jsou orientovány proti směru hodinových ručiček při pohledu
+# zvenčí (normály míří ven z tělesa).
+
+# Cílový počet trojúhelníků v jednom pásu při streamovaném exportu (~50 MB STL záznamů).
+STRIP_TARGET_TRIANGLES = 1 << 20
+
+
+def grid_faces(rows, cols, offset=0, flip=False, out=None):
+    """
+    Vrátí indexy trojúhelníků pravidelné mřížky rows x cols s řádkovým indexováním
+    vrcholů (index = řádek * cols + sloupec). Každý čtverec mřížky dává dva
+    trojúhelníky. Parametr `flip` otočí orientaci (použito pro spodní plochu).
+    Je-li zadáno `out` (pole 2*(rows-1)*(cols-1) x 3 int32), zapisuje se přímo do něj.
+    """
+    if out is None:
+        out = np.empty((2 * (rows - 1) * (cols - 1), 3), dtype=np.int32)
+    # Pohled (čtverce, 2 trojúhelníky, 3 rohy); plní se po sloupcích bez np.stack.
+    quads = out.reshape(rows - 1, cols - 1, 2, 3)
+    # Index levého dolního rohu každého čtverce mřížky.
+    v00 = np.arange(rows - 1, dtype=np.int32)[:, None] * cols + offset
+    v00 = v00 + np.arange(cols - 1, dtype=np.int32)[None, :]
+
+    quads[:, :, :, 0] = v00[:, :, None]
+    if flip:
+        quads[:, :, 0, 1] = v00 + cols + 1
+        quads[:, :, 0, 2] = v00 + 1
+        quads[:, :, 1, 1] = v00 + cols
+        quads[:, :, 1, 2] = quads[:, :, 0, 1]
+    else:
+        quads[:, :, 0, 1] = v00 + 1
+        quads[:, :, 0, 2] = v00 + cols + 1
+        quads[:, :, 1, 1] = quads[:, :, 0, 2]
+        quads[:, :, 1, 2] = v00 + cols
+    return out
+
+
+def wall_faces(chain_top, chain_bottom, closed=False, out=None):
+    """
+    Vytvoří boční stěnu mezi dvěma stejně dlouhými řetězci vrcholů (horní a spodní
+    hrana). Řetězce musí jít proti směru hodinových ručiček kolem tělesa (pohled
+    shora). Při `closed=True` se spojí i poslední vrchol s prvním.
+    """
+    if closed:
+        a_top, b_top = chain_top, np.roll(chain_top, -1)
+        a_bot, b_bot = chain_bottom, np.roll(chain_bottom, -1)
+    else:
+        a_top, b_top = chain_top[:-1], chain_top[1:]
+        a_bot, b_bot = chain_bottom[:-1], chain_bottom[1:]
+
+    if out is None:
+        out = np.empty((2 * a_top.size, 3), dtype=np.int32)
+    pairs = out.reshape(-1, 2, 3)
+    pairs[:, 0, 0] = a_bot
+    pairs[:, 0, 1] = b_bot
+    pairs[:, 0, 2] = b_top
+    pairs[:, 1, 0] = a_bot
+    pairs[:, 1, 1] = b_top
+    pairs[:, 1, 2] = a_top
+    return out
+
+
+def boundary_shell(
+    ring_top, ring_xy, first_index, z_base=0.0, walls=None, offset=None, z_frame=None
+):
+    """
+    Sestaví plášť tělesa pod uzavřenou okrajovou smyčkou horního povrchu: boční
+    stěny, volitelný rámeček (ořezový okraj) a plochou spodní plochu jako vějíř
+    ze středového bodu, tedy bez booleovských operací a s počtem trojúhelníků
+    úměrným jen obvodu.
+
+    `ring_top` jsou indexy okrajových vrcholů horního povrchu proti směru hodinových
+    ručiček (pohled shora) a `ring_xy` jejich souřadnice XY. `walls[k]` určuje,
+    zda hrana k -> k+1 dostane stěnu (False u řezu mezi pásy, None = všechny).
+    `offset` (L, 2) posouvá vnější okraj rámečku ve výšce `z_frame`; bez něj
+    vedou stěny rovnou dolů do `z_base`. Vrací nové vrcholy (číslované od
+    `first_index`) a trojúhelníky.
+    """
+    count = len(ring_top)
+    layers = 1 if offset is None else 3
+    vertices = np.empty((layers * count + 1, 3), dtype=np.float32)
+    ground_xy = ring_xy if offset is None else ring_xy + offset
+    if offset is not None:
+        # Vnitřní a vnější okraj rámečku; spodní vrstva je pod vnějším okrajem.
+        vertices[:count, :2] = ring_xy
+        vertices[count : 2 * count, :2] = ground_xy
+        vertices[: 2 * count, 2] = z_base if z_frame is None else z_frame
+    vertices[(layers - 1) * count : -1, :2] = ground_xy
+    vertices[(layers - 1) * count : -1, 2] = z_base
+    lo, hi = ground_xy.min(axis=0), ground_xy.max(axis=0)
+    vertices[-1] = ((lo[0] + hi[0]) / 2, (lo[1] + hi[1]) / 2, z_base)
+
+    chains = [np.asarray(ring_top, dtype=np.int32)]
+    for layer in range(layers):
+        start = first_index + layer * count
+        chains.append(np.arange(start, start + count, dtype=np.int32))
+
+    parts = []
+    for upper, lower in zip(chains[:-1], chains[1:]):
+        faces = wall_faces(upper, lower, closed=True)
+        if walls is not None:
+            faces = faces.reshape(count, 2, 3)[walls].reshape(-1, 3)
+        parts.append(faces)
+    ground = chains[-1]
+    center = np.full(count, first_index + layers * count, dtype=np.int32)
+    parts.append(np.stack((center, np.roll(ground, -1), ground), axis=1))
+    return vertices, np.concatenate(parts)
+
+
+def frame_offsets(ring_r, ring_c, rows, cols, margin, front=True, back=True):
+    """
+    Vrátí posun (L, 2) okrajových vrcholů pro rámeček šířky `margin` podle jejich
+    polohy na obvodu mřížky (rohy se posouvají v obou osách). Přední/zadní
+    okraj se posouvá jen, pokud je skutečnou stěnou (ne řezem mezi pásy).
+    """
+    offset = np.zeros((len(ring_r), 2), dtype=np.float32)
+    offset[ring_c == 0, 0] = -margin
+    offset[ring_c == cols - 1, 0] = margin
+    if front:
+        offset[ring_r == 0, 1] = -margin
+    if back:
+        offset[ring_r == rows - 1, 1] = margin
+    return offset
+
+
+def solid_strip(
+    x,
+    y,
+    z_top,
+    z_base=0.0,
+    first=True,
+    last=True,
+    flat_bottom=True,
+    margin=0.0,
+    z_frame=None,
+):
+    """
+    Sestaví část tělesa pro souvislý pás řádků výškové mapy: horní reliéf, boční
+    stěny (přední/zadní jen u prvního/posledního pásu) a plochou spodní plochu.
+    `x` jsou souřadnice sloupců, `y` souřadnice řádků pásu (v mm), `z_top` pole
+    (řádky, sloupce). Vrcholy i trojúhelníky se zapisují přímo do jednoho
+    předalokovaného pole float32, resp. int32.
+
+    Při `flat_bottom` je spodní plocha hrubý vějíř napojený na okraj (viz
+    `boundary_shell`), jinak plná mřížka pod reliéfem. `margin` > 0 přidá
+    rámeček této šířky ve výšce `z_frame` (ořezový okraj podstavy).
+    """
+    if not flat_bottom and not margin:
+        return _grid_bottom_strip(x, y, z_top, z_base, first, last)
+
+    rows, cols = z_top.shape
+    n = rows * cols
+    idx = np.arange(n, dtype=np.int32).reshape(rows, cols)
+    # Okrajová smyčka proti směru hodinových ručiček; u řezu mezi pásy stačí rohy.
+    sides = (
+        idx[0, :] if first else idx[0, [0, -1]],
+        idx[:, -1],
+        idx[-1, ::-1] if last else idx[-1, [-1, 0]],
+        idx[::-1, 0],
+    )
+    ring = np.concatenate([side[:-1] for side in sides])
+    walls = np.concatenate(
+        [
+            np.full(len(side) - 1, wall, dtype=bool)
+            for side, wall in zip(sides, (first, True, last, True))
+        ]
+    )
+    ring_r, ring_c = np.divmod(ring, cols)
+    ring_xy = np.stack((x[ring_c], y[ring_r]), axis=1)
+    offset = None
+    if margin:
+        offset = frame_offsets(ring_r, ring_c, rows, cols, margin, first, last)
+    shell_vertices, shell_faces = boundary_shell(
+        ring, ring_xy, n, z_base, walls, offset, z_frame
+    )
+
+    vertices = np.empty((n + len(shell_vertices), 3), dtype=np.float32)
+    top = vertices[:n].reshape(rows, cols, 3)
+    top[:, :, 0] = x[None, :]
+    top[:, :, 1] = y[:, None]
+    top[:, :, 2] = z_top
+    vertices[n:] = shell_vertices
+
+    grid_count = 2 * (rows - 1) * (cols - 1)
+    faces = np.empty((grid_count + len(shell_faces), 3), dtype=np.int32)
+    grid_faces(rows, cols, out=faces[:grid_count])
+    faces[grid_count:] = shell_faces
+    return vertices, faces
+
+
+def _grid_bottom_strip(x, y, z_top, z_base, first, last):
+    """Pás tělesa se spodní plochou jako plnou mřížkou (bez `flat_bottom`)."""
+    rows, cols = z_top.shape
+    n = rows * cols
+
+    # Horní a spodní vrstva sdílí XY souřadnice, liší se pouze výškou.
+    vertices = np.empty((2 * n, 3), dtype=np.float32)
+    top = vertices[:n].reshape(rows, cols, 3)
+    bottom = vertices[n:].reshape(rows, cols, 3)
+    top[:, :, 0] = x[None, :]
+    top[:, :, 1] = y[:, None]
+    top[:, :, 2] = z_top
+    bottom[:, :, :2] = top[:, :, :2]
+    bottom[:, :, 2] = z_base
+
+    idx = np.arange(n, dtype=np.int32).reshape(rows, cols)
+    # Řetězce okrajových vrcholů vedené proti směru hodinových ručiček.
+    chains = [idx[:, -1], idx[::-1, 0]]
+    if first:
+        chains.append(idx[0, :])
+    if last:
+        chains.append(idx[-1, ::-1])
+
+    grid_count = 2 * (rows - 1) * (cols - 1)
+    wall_count = sum(2 * (len(chain) - 1) for chain in chains)
+    faces = np.empty((2 * grid_count + wall_count, 3), dtype=np.int32)
+    grid_faces(rows, cols, out=faces[:grid_count])
+    grid_faces(rows, cols, offset=n, flip=True, out=faces[grid_count : 2 * grid_count])
+    start = 2 * grid_count
+    for chain in chains:
+        end = start + 2 * (len(chain) - 1)
+        wall_faces(chain, chain + n, out=faces[start:end])
+        start = end
+    return vertices, faces
+
+
+def mask_quads(inside):
+    """
+    Převede masku pixelů (řádky, sloupce; True = uvnitř) na masku čtverců mřížky:
+    čtverec patří do modelu, jen když jsou uvnitř všechny jeho čtyři rohy.
+    Čtverce, které se dotýkají jen rohem, by sdílely svislou hranu stěny mezi
+    čtyřmi stěnami (nevarietní hrana, kterou slicery hlásí jako chybu). Proto se
+    v každém takovém dotyku vynechá spodní z obou čtverců; vynechání může vytvořit
+    nový dotyk rohem, takže se opakuje, dokud nějaký zbývá.
+    """
+    quads = inside[:-1, :-1] & inside[:-1, 1:] & inside[1:, :-1] & inside[1:, 1:]
+    while True:
+        upper_left, upper_right = quads[:-1, :-1], quads[:-1, 1:]
+        lower_left, lower_right = quads[1:, :-1], quads[1:, 1:]
+        # Dotyk rohem: úhlopříčné dvojice jsou shodné a navzájem různé.
+        touch = upper_left ^ upper_right
+        touch &= upper_left == lower_right
+        touch &= upper_right == lower_left
+        if not touch.any():
+            return quads
+        lower_right[touch & upper_left] = False
+        lower_left[touch & upper_right] = False
+
+
+def _run_bounds(quads):
+    """Vrátí (řádek, c0, c1) souvislých úseků čtverců; c0..c1 jsou indexy vrcholů."""
+    padded = np.zeros((quads.shape[0], quads.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = quads
+    step = np.diff(padded, axis=1)
+    row, c0 = np.nonzero(step == 1)
+    _, c1 = np.nonzero(step == -1)
+    return row, c0, c1
+
+
+def _run_endpoints(quad_row, cols):
+    """Vrcholy na začátcích a koncích úseků jedné řady čtverců."""
+    marks = np.zeros(cols, dtype=bool)
+    edge = np.diff(np.concatenate(([0], quad_row.astype(np.int8), [0])))
+    marks[np.flatnonzero(edge != 0)] = True
+    return marks
+
+
+def masked_strip(x, y, z_top, quads, above=None, below=None, z_base=0.0):
+    """
+    Sestaví vodotěsné těleso (nebo jeho pás) jen z čtverců mřížky v masce `quads`
+    (řádky-1, sloupce-1): horní reliéf, boční stěny po obrysu masky a plochou
+    spodní plochu. `above`/`below` jsou řady čtverců sousedních pásů (None = okraj
+    obrázku), aby spodní plochy sousedních pásů na sebe přesně navazovaly.
+
+    Spodní plocha se skládá z vodorovných úseků čtverců; na každé čáře mřížky
+    se použijí jen vrcholy stěn a konce úseků obou sousedních řad, takže
+    vnitřek masky má jen několik trojúhelníků na úsek. Maska nesmí obsahovat
+    čtverce, které se dotýkají jen rohem (viz `mask_quads`), jinak by svislá
+    hrana stěny v tomto rohu patřila čtyřem stěnám.
+    """
+    rows, cols = z_top.shape
+    n = rows * cols
+    vertices = np.empty((2 * n, 3), dtype=np.float32)
+    top = vertices[:n].reshape(rows, cols, 3)
+    bottom = vertices[n:].reshape(rows, cols, 3)
+    top[:, :, 0] = x[None, :]
+    top[:, :, 1] = y[:, None]
+    top[:, :, 2] = z_top
+    bottom[:, :, :2] = top[:, :, :2]
+    bottom[:, :, 2] = z_base
+
+    # Řady čtverců včetně sousedních pásů: čára mřížky l leží mezi pad[l] a pad[l+1].
+    pad = np.zeros((rows + 1, cols - 1), dtype=bool)
+    pad[1:-1] = quads
+    if above is not None:
+        pad[0] = above
+    if below is not None:
+        pad[-1] = below
+
+    top_faces = grid_faces(rows, cols)[np.repeat(quads.ravel(), 2)]
+
+    # Hrany obrysu ve směru obíhání horních trojúhelníků (a -> b).
+    idx = np.arange(n, dtype=np.int32).reshape(rows, cols)
+    horizontal = np.zeros((rows - 1, cols + 1), dtype=bool)
+    horizontal[:, 1:-1] = quads
+    edges = [
+        # Horní hrana čtverce bez souseda nad ním.
+        (idx[:-1, :-1][quads & ~pad[:-2]], idx[:-1, 1:][quads & ~pad[:-2]]),
+        # Dolní hrana čtverce bez souseda pod ním.
+        (idx[1:, 1:][quads & ~pad[2:]], idx[1:, :-1][quads & ~pad[2:]]),
+        # Levá a pravá hrana čtverce bez souseda vlevo/vpravo.
+        (
+            idx[1:, :-1][quads & ~horizontal[:, :-2]],
+            idx[:-1, :-1][quads & ~horizontal[:, :-2]],
+        ),
+        (
+            idx[:-1, 1:][quads & ~horizontal[:, 2:]],
+            idx[1:, 1:][quads & ~horizontal[:, 2:]],
+        ),
+    ]
+    a = np.concatenate([e[0] for e in edges])
+    b = np.concatenate([e[1] for e in edges])
+    walls = np.empty((2 * len(a), 3), dtype=np.int32)
+    walls[0::2] = np.stack((b, a, a + n), axis=1)
+    walls[1::2] = np.stack((b, a + n, b + n), axis=1)
+
+    # Vrcholy spodní plochy na každé čáře mřížky: vrcholy stěn a konce úseků.
+    needed = np.zeros((rows, cols), dtype=bool)
+    wall_edge = pad[:-1] ^ pad[1:]
+    needed[:, :-1] |= wall_edge
+    needed[:, 1:] |= wall_edge
+    for line in range(rows):
+        needed[line] |= _run_endpoints(pad[line], cols)
+        needed[line] |= _run_endpoints(pad[line + 1], cols)
+
+    bottom_faces = _bottom_runs(quads, needed, cols) + n
+    faces = np.concatenate((top_faces, walls, bottom_faces))
+    return vertices, faces
+
+
+def _bottom_runs(quads, needed, cols):
+    """
+    Triangulace spodní plochy po úsecích: každý úsek je obdélník s body na horní
+    (čára i) a dolní (čára i+1) straně, spojené "zipem" podle souřadnice sloupce.
+    Vrací indexy do mřížky spodních vrcholů, orientované normálou dolů.
+    """
+    run_row, run_c0, run_c1 = _run_bounds(quads)
+    if len(run_row) == 0:
+        return np.empty((0, 3), dtype=np.int32)
+    run_start = run_row.astype(np.int64) * cols + run_c0
+    run_end = run_row.astype(np.int64) * cols + run_c1
+
+    def chain(lines):
+        # Body na čarách `lines` patřící některému úseku; klíč = řádek úseku * cols + c.
+        line, c = np.nonzero(needed[lines])
+        key = line.astype(np.int64) * cols + c
+        run = np.searchsorted(run_start, key, side="right") - 1
+        keep = (run >= 0) & (key <= run_end[np.maximum(run, 0)])
+        return key[keep], run[keep]
+
+    t_key, t_run = chain(slice(0, -1))
+    b_key, b_run = chain(slice(1, None))
+    t_vertex = t_key.astype(np.int32)
+    b_vertex = (b_key + cols).astype(np.int32)
+
+    # Posun po horní straně: trojúhelník (t_prev, t, b) s posledním b vlevo od t.
+    t_step = np.flatnonzero(t_run[1:] == t_run[:-1]) + 1
+    apex_b = np.searchsorted(b_key, t_key[t_step], side="left") - 1
+    # Posun po dolní straně: trojúhelník (b_prev, b, t) s posledním t nejvýše u b.
+    b_step = np.flatnonzero(b_run[1:] == b_run[:-1]) + 1
+    apex_t = np.searchsorted(t_key, b_key[b_step], side="right") - 1
+
+    # Horní strana leží na menším y, takže (t_prev, t, b) je při pohledu shora
+    # proti směru hodinových ručiček; pořadí (t_prev, b, t) otočí normálu dolů.
+    # Trojúhelník (b_prev, b, t) je po směru hodinových ručiček už sám.
+    faces = np.empty((len(t_step) + len(b_step), 3), dtype=np.int32)
+    upper = faces[: len(t_step)]
+    upper[:, 0] = t_vertex[t_step - 1]
+    upper[:, 1] = b_vertex[apex_b]
+    upper[:, 2] = t_vertex[t_step]
+    lower = faces[len(t_step) :]
+    lower[:, 0] = b_vertex[b_step - 1]
+    lower[:, 1] = b_vertex[b_step]
+    lower[:, 2] = t_vertex[apex_t]
+    return faces
+
+
+def build_solid_mesh(x, y, z_top, z_base=0.0, quads=None, **options):
+    """
+    Sestaví vodotěsné těleso z výškové mapy: horní reliéf, plochou spodní plochu
+    ve výšce `z_base` a čtyři boční stěny napojené na okraj mřížky
+    (volby viz `solid_strip`). S maskou čtverců `quads` se síť omezí na masku
+    a stěny vedou po jejím obrysu (viz `masked_strip`).
+    """
+    if quads is not None:
+        return masked_strip(x, y, z_top, quads, z_base=z_base)
+    return solid_strip(x, y, z_top, z_base, **options)
+
+
+def strip_rows_for_width(cols, target_triangles=STRIP_TARGET_TRIANGLES):
+    """Vrátí počet řádků pásu, aby měl přibližně `target_triangles` trojúhelníků."""
+    # Každý čtverec mřížky dává 2 trojúhelníky nahoře a 2 dole.
+    return max(1, target_triangles // (4 * max(cols - 1, 1)))
+
+
+def strip_ranges(rows, strip_rows):
+    """
+    Rozdělí řádky 0..rows-1 na pásy (r0, r1) po nejvýše `strip_rows` čtvercích.
+    Sousední pásy sdílí jeden řádek, aby na sebe povrch plynule navazoval.
+    """
+    r0 = 0
+    while r0 < rows - 1:
+        r1 = min(r0 + strip_rows, rows - 1)
+        yield r0, r1
+        r0 = r1
+
+
+def build_solid_strip(x, y, z_rows, r0, r1, z_base=0.0, quads=None, **options):
+    """
+    Sestaví pás tělesa pro řádky r0..r1 (včetně). Pásy jsou na sobě nezávislé,
+    takže je lze počítat souběžně v libovolném pořadí. `options` jsou volby
+    spodní plochy a rámečku pro `solid_strip`; s maskou čtverců `quads` (celého
+    obrázku) se pás sestaví jen z maskované oblasti.
+    """
+    if quads is not None:
+        above = quads[r0 - 1] if r0 > 0 else None
+        below = quads[r1] if r1 < len(quads) else None
+        return masked_strip(
+            x, y[r0 : r1 + 1], z_rows(r0, r1 + 1), quads[r0:r1], above, below, z_base
+        )
+    return solid_strip(
+        x,
+        y[r0 : r1 + 1],
+        z_rows(r0, r1 + 1),
+        z_base,
+        r0 == 0,
+        r1 == len(y) - 1,
+        **options,
+    )
+
+
+def solid_strip_triangles(
+    rows, cols, first=True, last=True, flat_bottom=True, margin=0.0
+):
+    """
+    Vrátí počet trojúhelníků, které `solid_strip` sestaví pro pás rows x cols
+    vrcholů (se stejnými volbami), bez sestavení sítě.
+    """
+    grid = 2 * (rows - 1) * (cols - 1)
+    # Hrany okraje se stěnou; řez mezi pásy stěnu nemá.
+    walls = 2 * (rows - 1) + (cols - 1) * (int(first) + int(last))
+    if not flat_bottom and not margin:
+        return 2 * grid + 2 * walls
+    # Okrajová smyčka má u řezu mezi pásy jedinou hranu (mezi rohy).
+    ring = walls + (not first) + (not last)
+    layers = 3 if margin else 1
+    return grid + 2 * layers * walls + ring
+
+
+def masked_triangles(quads):
+    """
+    Vrátí počet trojúhelníků, které `masked_strip` sestaví pro celou masku
+    čtverců `quads`, bez sestavení sítě. Sousední pásy si předávají řady
+    čtverců (`above`/`below`), takže součet přes pásy je stejný.
+    """
+    rows, cols = quads.shape[0] + 1, quads.shape[1] + 1
+    pad = np.zeros((rows + 1, cols - 1), dtype=bool)
+    pad[1:-1] = quads
+    horizontal = np.zeros((rows - 1, cols + 1), dtype=bool)
+    horizontal[:, 1:-1] = quads
+    wall_edge = pad[:-1] ^ pad[1:]
+    walls = np.count_nonzero(wall_edge)
+    walls += np.count_nonzero(horizontal[:, :-1] ^ horizontal[:, 1:])
+
+    # Body spodní plochy stejně jako v `masked_strip`: vrcholy stěn a konce úseků.
+    needed = np.zeros((rows, cols), dtype=bool)
+    needed[:, :-1] |= wall_edge
+    needed[:, 1:] |= wall_edge
+    padded = np.zeros((rows + 1, cols + 1), dtype=np.int8)
+    padded[:, 1:-1] = pad
+    ends = np.diff(padded, axis=1) != 0
+    needed |= ends[:-1] | ends[1:]
+    # Vrchol leží na některém úseku řady, pokud sousedí s čtvercem v masce.
+    cover = np.zeros((rows - 1, cols), dtype=bool)
+    cover[:, :-1] |= quads
+    cover[:, 1:] |= quads
+    runs = np.count_nonzero(np.diff(padded[1:-1], axis=1) == 1)
+    # Zip úseku s t body nahoře a b body dole má (t - 1) + (b - 1) trojúhelníků.
+    points = np.count_nonzero(needed[:-1] & cover)
+    points += np.count_nonzero(needed[1:] & cover)
+    return 2 * np.count_nonzero(quads) + 2 * walls + points - 2 * runs
@@ -0,0 +1,103 @@
+# src/instrumentation.py
+
+# Měření jednotlivých etap zpracování obrazu a generování STL.
+# Objekt `Tracer` se předává spolu s parametry do `process_image`, `ProcessingPipeline.run`
+# a `image_to_stl` a zaznamenává pro každou etapu dobu trvání, počty prvků
+# (pixely, vrcholy, trojúhelníky, bajty) a volitelně špičkovou alokovanou paměť.
+
+import cProfile
+import itertools
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Sběr záznamů o etapách. Každý záznam je slovník s klíči `name`, `duration_s`,
+    případně `alloc_peak_bytes` (při `track_memory=True`, měřeno přes tracemalloc,
+    tedy jen alokace NumPy/Pythonu, ne interní paměť OpenCV) a libovolnými počty.
+    Při zadání `profile_dir` se bloky označené `profile()` ukládají jako cProfile dumpy.
+    """
+
+    _profile_counter = itertools.count()
+
+    def __init__(self, track_memory=False, profile_dir=None):
+        self.track_memory = track_memory
+        self.profile_dir = profile_dir
+        self.records = []
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name, **counts):
+        """Změří blok kódu jako jednu etapu; počty lze doplnit přes `count`."""
+        record = {"name": name, **counts}
+        frame = {"record": record, "child_peak": 0}
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            frame["start_bytes"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["duration_s"] = time.perf_counter() - start
+            self._stack.pop()
+            if self.track_memory:
+                # Vnořená etapa resetuje špičku, proto se bere i maximum z potomků.
+                peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+                record["alloc_peak_bytes"] = max(0, peak - frame["start_bytes"])
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent["child_peak"] = max(parent["child_peak"], peak)
+            self.records.append(record)
+
+    def count(self, **counts):
+        """Přičte počty prvků k právě běžící etapě."""
+        if not self._stack:
+            return
+        record = self._stack[-1]["record"]
+        for key, value in counts.items():
+            record[key] = record.get(key, 0) + value
+
+    def event(self, name, **fields):
+        """Zaznamená okamžitou událost bez měření času (např. zásah do cache)."""
+        self.records.append({"name": name, "duration_s": 0.0, **fields})
+
+    @contextmanager
+    def profile(self, name):
+        """Pokud je nastaven `profile_dir`, uloží cProfile dump daného bloku."""
+        if not self.profile_dir:
+            yield
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            index = next(self._profile_counter)
+            path = os.path.join(
+                self.profile_dir, f"{name}-{os.getpid()}-{index}.prof"
+            )
+            profiler.dump_stats(path)
+            self.event("profile", target=name, path=path)
+
+    def to_dict(self):
+        return {"stages": list(self.records)}
+
+    def summary(self, prefix=""):
+        """Krátký jednořádkový přehled pro stavový řádek GUI."""
+        parts = []
+        for r in self.records:
+            if not r["name"].startswith(prefix) or r.get("cached"):
+                continue
+            label = r["name"].split(".")[-1]
+            if "hit" in r:
+                label = "cache hit" if r["hit"] else "cache miss"
+            parts.append(f"{label} {r['duration_s'] * 1000:.0f} ms")
+        return ", ".join(parts) if parts else "cached"
@@ -1,11 +1,23 @@
 import sys
-import os
-from gui import ReliefApp
+import time
+
+# Okamžik spuštění pro měření doby startu GUI (zobrazí se ve stavovém panelu).
+_STARTED_AT = time.perf_counter()
 
 
 def main():
-    """Hlavní spouštěcí bod aplikace."""
-    app = ReliefApp()
+    """
+    Hlavní spouštěcí bod aplikace. Bez argumentů spustí GUI, s argumenty
+    dávkový převod (viz `python main.py --help`), který nenačítá tkinter.
+    """
+    if len(sys.argv) > 1:
+        from batch import main as batch_main
+
+        sys.exit(batch_main(sys.argv[1:]))
+
+    from gui import ReliefApp
+
+    app = ReliefApp(started_at=_STARTED_AT)
     app.mainloop()
 
 
@@ -0,0 +1,301 @@
+import gzip
+import os
+import zipfile
+
+import numpy as np
+
+
+# Zápis trojúhelníkových sítí do souborů bez závislosti na PyVista/VTK.
+# Binární STL: 80 bajtů hlavička, uint32 počet trojúhelníků a pro každý trojúhelník
+# záznam 50 bajtů (normála, tři vrcholy, atribut). Formát výstupu se volí podle
+# přípony souboru: .stl (binární nebo ASCII), .stl.gz (binární STL v gzipu)
+# a indexované formáty .3mf a .ply se sdílenou tabulkou vrcholů.
+
+STL_HEADER_SIZE = 80
+# Počet trojúhelníků převáděných na záznamy najednou; omezuje dočasnou paměť
+# při zápisu (~13 MB záznamů na dávku) bez ohledu na velikost sítě.
+STL_WRITE_CHUNK = 1 << 18
+# Textový zápis je zhruba 25x pomalejší, proto menší dávky, aby průběh exportu
+# šel hlásit (a export zrušit) v kratších intervalech.
+ASCII_WRITE_CHUNK = 1 << 16
+# Úroveň komprese pro .stl.gz a .3mf. Nejrychlejší úroveň dává u sítí z výškových
+# map téměř stejný poměr (~2.7x u STL) jako výchozí 6, ale je zhruba 3x rychlejší.
+COMPRESS_LEVEL = 1
+# Velikost bloku při dodatečné kompresi streamovaného STL.
+COMPRESS_BLOCK = 1 << 22
+STL_RECORD_DTYPE = np.dtype(
+    [
+        ("normal", "<f4", (3,)),
+        ("vertices", "<f4", (3, 3)),
+        ("attr", "<u2"),
+    ]
+)
+
+
+def triangles_to_records(vertices, faces):
+    """
+    Převede indexovanou síť na předalokované pole STL záznamů.
+    Normály se počítají vektorově přímo do pole záznamů.
+    """
+    records = np.zeros(len(faces), dtype=STL_RECORD_DTYPE)
+    tri = records["vertices"]
+    # Po jednotlivých rozích, aby nevzniklo dočasné pole (M, 3, 3).
+    for corner in range(3):
+        np.take(vertices, faces[:, corner], axis=0, out=tri[:, corner])
+
+    normals = records["normal"]
+    edge1 = tri[:, 1] - tri[:, 0]
+    edge2 = tri[:, 2] - tri[:, 0]
+    normals[...] = np.cross(edge1, edge2)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    # Degenerované trojúhelníky (nulová plocha) dostanou nulovou normálu.
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return records
+
+
+def mesh_format(path):
+    """Vrátí formát výstupu podle přípony: "stl", "stl.gz", "3mf" nebo "ply"."""
+    name = path.lower()
+    for suffix in MESH_FORMATS:
+        if name.endswith("." + suffix):
+            return suffix
+    return "stl"
+
+
+def compact_mesh(vertices, faces):
+    """Odstraní vrcholy, na které neodkazuje žádný trojúhelník (indexované formáty)."""
+    used = np.zeros(len(vertices), dtype=bool)
+    used[faces] = True
+    if used.all():
+        return vertices, faces
+    remap = np.cumsum(used, dtype=np.int64).astype(np.int32) - 1
+    return vertices[used], remap[faces]
+
+
+def _write_records(f, vertices, faces, progress=None):
+    """
+    Zapíše trojúhelníky do otevřeného souboru po dávkách `STL_WRITE_CHUNK`.
+    Po každé dávce volá `progress(zapsáno, celkem)`, pokud je zadán.
+    """
+    for start in range(0, len(faces), STL_WRITE_CHUNK):
+        chunk = faces[start : start + STL_WRITE_CHUNK]
+        # Zápis přes buffer (ne `tofile`), aby fungoval i pro gzip a ZIP proudy.
+        f.write(memoryview(triangles_to_records(vertices, chunk)).cast("B"))
+        if progress is not None:
+            progress(start + len(chunk), len(faces))
+    return len(faces)
+
+
+def write_binary_stl(path, vertices, faces, header=b"image_to_stl", progress=None):
+    """
+    Zapíše indexovanou síť (vrcholy, trojúhelníky) do binárního STL souboru.
+    Záznamy se tvoří po dávkách, takže v paměti nikdy není celý obsah souboru.
+    """
+    with open(path, "wb") as f:
+        f.write(header[:STL_HEADER_SIZE].ljust(STL_HEADER_SIZE, b"\0"))
+        f.write(np.uint32(len(faces)).tobytes())
+        return _write_records(f, vertices, faces, progress)
+
+
+def write_gzip_stl(path, vertices, faces, header=b"image_to_stl", progress=None):
+    """Zapíše binární STL komprimovaný gzipem (pro přenos a archivaci)."""
+    with gzip.open(path, "wb", compresslevel=COMPRESS_LEVEL) as f:
+        f.write(header[:STL_HEADER_SIZE].ljust(STL_HEADER_SIZE, b"\0"))
+        f.write(np.uint32(len(faces)).tobytes())
+        return _write_records(f, vertices, faces, progress)
+
+
+_ASCII_FACET = (
+    "facet normal %e %e %e\n  outer loop\n"
+    "    vertex %e %e %e\n    vertex %e %e %e\n    vertex %e %e %e\n"
+    "  endloop\nendfacet\n"
+)
+
+
+def write_ascii_stl(path, vertices, faces, name="image_to_stl", progress=None):
+    """Zapíše síť jako textové (ASCII) STL; výrazně větší a pomalejší než binární."""
+    with open(path, "w", encoding="ascii") as f:
+        f.write(f"solid {name}\n")
+        for start in range(0, len(faces), ASCII_WRITE_CHUNK):
+            records = triangles_to_records(
+                vertices, faces[start : start + ASCII_WRITE_CHUNK]
+            )
+            values = np.concatenate(
+                (records["normal"], records["vertices"].reshape(-1, 9)), axis=1
+            )
+            f.write((_ASCII_FACET * len(values)) % tuple(values.ravel().tolist()))
+            if progress is not None:
+                progress(start + len(values), len(faces))
+        f.write(f"endsolid {name}\n")
+    return len(faces)
+
+
+PLY_FACE_DTYPE = np.dtype([("count", "u1"), ("vertices", "<i4", (3,))])
+
+
+def write_binary_ply(path, vertices, faces, progress=None):
+    """Zapíše indexovanou síť jako binární PLY (little endian) se sdílenými vrcholy."""
+    vertices, faces = compact_mesh(vertices, faces)
+    header = (
+        "ply\nformat binary_little_endian 1.0\ncomment image_to_stl\n"
+        f"element vertex {len(vertices)}\n"
+        "property float x\nproperty float y\nproperty float z\n"
+        f"element face {len(faces)}\n"
+        "property list uchar int vertex_indices\nend_header\n"
+    )
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        np.ascontiguousarray(vertices, dtype="<f4").tofile(f)
+        for start in range(0, len(faces), STL_WRITE_CHUNK):
+            chunk = faces[start : start + STL_WRITE_CHUNK]
+            records = np.empty(len(chunk), dtype=PLY_FACE_DTYPE)
+            records["count"] = 3
+            records["vertices"] = chunk
+            records.tofile(f)
+            if progress is not None:
+                progress(start + len(chunk), len(faces))
+    return len(faces)
+
+
+_3MF_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" '
+    'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" '
+    'ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    "</Types>"
+)
+_3MF_RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    "<Relationships "
+    'xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    "</Relationships>"
+)
+
+
+def write_3mf(path, vertices, faces, progress=None):
+    """
+    Zapíše síť jako 3MF: ZIP archiv s XML modelem (jednotky mm), sdílenou tabulkou
+    vrcholů a trojúhelníky. XML se generuje a komprimuje po dávkách; průběh
+    se hlásí v počtu zapsaných vrcholů a trojúhelníků.
+    """
+    vertices, faces = compact_mesh(vertices, faces)
+    total = len(vertices) + len(faces)
+    with zipfile.ZipFile(
+        path, "w", zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL
+    ) as archive:
+        archive.writestr("[Content_Types].xml", _3MF_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _3MF_RELS)
+        with archive.open("3D/3dmodel.model", "w", force_zip64=True) as f:
+            f.write(
+                b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                b'<model unit="millimeter" xml:lang="en-US" xmlns='
+                b'"http://schemas.microsoft.com/3dmanufacturing/core/2015/02">'
+                b'<resources><object id="1" type="model"><mesh><vertices>\n'
+            )
+            for start in range(0, len(vertices), STL_WRITE_CHUNK):
+                chunk = vertices[start : start + STL_WRITE_CHUNK]
+                text = '<vertex x="%.4f" y="%.4f" z="%.4f"/>\n' * len(chunk)
+                f.write((text % tuple(chunk.ravel().tolist())).encode("ascii"))
+                if progress is not None:
+                    progress(start + len(chunk), total)
+            f.write(b"</vertices><triangles>\n")
+            for start in range(0, len(faces), STL_WRITE_CHUNK):
+                chunk = faces[start : start + STL_WRITE_CHUNK]
+                text = '<triangle v1="%d" v2="%d" v3="%d"/>\n' * len(chunk)
+                f.write((text % tuple(chunk.ravel().tolist())).encode("ascii"))
+                if progress is not None:
+                    progress(len(vertices) + start + len(chunk), total)
+            f.write(
+                b"</triangles></mesh></object></resources>"
+                b'<build><item objectid="1"/></build></model>\n'
+            )
+    return len(faces)
+
+
+MESH_FORMATS = {
+    "stl.gz": write_gzip_stl,
+    "stl": write_binary_stl,
+    "3mf": write_3mf,
+    "ply": write_binary_ply,
+}
+
+
+def write_mesh(path, vertices, faces, binary=True, progress=None):
+    """
+    Zapíše síť ve formátu podle přípony `path` (viz `mesh_format`). Parametr
+    `binary=False` zvolí u přípony .stl textové STL. Vrací počet trojúhelníků.
+    `progress(hotovo, celkem)` se volá po každé zapsané dávce; výjimka z něj
+    (např. zrušení exportu) zápis přeruší.
+    """
+    fmt = mesh_format(path)
+    if fmt == "stl" and not binary:
+        return write_ascii_stl(path, vertices, faces, progress=progress)
+    return MESH_FORMATS[fmt](path, vertices, faces, progress=progress)
+
+
+class StlStreamWriter:
+    """
+    Postupný zápis binárního STL po částech (např. po pásech výškové mapy).
+    Počet trojúhelníků v hlavičce se zapíše jako 0 a doplní se při uzavření souboru,
+    takže v paměti je vždy jen aktuálně zapisovaná část sítě. U přípony .stl.gz
+    se zapisuje do dočasného souboru, který se po doplnění hlavičky zkomprimuje;
+    průběh komprese se hlásí přes `progress(hotovo, celkem)` v bajtech.
+    """
+
+    def __init__(self, path, header=b"image_to_stl", progress=None):
+        self.path = path
+        self.header = header
+        self.progress = progress
+        self.count = 0
+        self._file = None
+        self._compress = mesh_format(path) == "stl.gz"
+        self._raw_path = path + ".part" if self._compress else path
+
+    def __enter__(self):
+        self._file = open(self._raw_path, "wb")
+        self._file.write(self.header[:STL_HEADER_SIZE].ljust(STL_HEADER_SIZE, b"\0"))
+        self._file.write(np.uint32(0).tobytes())
+        return self
+
+    def write_records(self, records):
+        """Připojí již převedené STL záznamy (viz `triangles_to_records`)."""
+        records.tofile(self._file)
+        self.count += len(records)
+        return len(records)
+
+    def close(self):
+        if self._file is None:
+            return
+        # Doplnění skutečného počtu trojúhelníků do hlavičky.
+        self._file.seek(STL_HEADER_SIZE)
+        self._file.write(np.uint32(self.count).tobytes())
+        self._file.close()
+        self._file = None
+        if self._compress:
+            try:
+                self._compress_raw()
+            finally:
+                os.remove(self._raw_path)
+
+    def _compress_raw(self):
+        total = os.path.getsize(self._raw_path)
+        with open(self._raw_path, "rb") as src:
+            with gzip.open(self.path, "wb", compresslevel=COMPRESS_LEVEL) as dst:
+                for block in iter(lambda: src.read(COMPRESS_BLOCK), b""):
+                    dst.write(block)
+                    if self.progress is not None:
+                        self.progress(src.tell(), total)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._compress and self._file is not None:
+            # Při chybě se nedokončený dočasný soubor nekomprimuje.
+            self._file.close()
+            self._file = None
+            os.remove(self._raw_path)
+            return False
+        self.close()
+        return False
@@ -0,0 +1,72 @@
+# src/preview_worker.py
+
+# Výpočet náhledu ve vedlejším vlákně. Uchovává se vždy jen nejnovější úloha;
+# každá nová úloha zvýší číslo generace, podle kterého běžící výpočet pozná,
+# že je zastaralý, a výsledky starších generací se zahodí.
+
+import threading
+import traceback
+
+
+class PreviewWorker:
+    """
+    Jedno vlákno na pozadí, které postupně zpracovává úlohy náhledu.
+    `compute(job, is_stale)` se volá ve vlákně pracovníka a `is_stale()` vrací True,
+    jakmile byla zadána novější úloha. `deliver(generation, result)` se volá
+    ve vlákně pracovníka s výsledkem; příjemce ho musí předat do hlavního vlákna
+    (v Tkinteru přes `after(0, ...)`) a porovnat generaci s `self.generation`.
+    Volitelný `follow_up(job, is_stale)` je méně naléhavý krok téže úlohy: spustí
+    se až po doručení výsledku `compute` a jen pokud mezitím nepřišla novější
+    úloha; jeho výsledek dostane `deliver_follow_up(generation, result)`.
+    """
+
+    def __init__(self, compute, deliver, follow_up=None, deliver_follow_up=None):
+        self._compute = compute
+        self._deliver = deliver
+        self._follow_up = follow_up
+        self._deliver_follow_up = deliver_follow_up
+        self._condition = threading.Condition()
+        self._pending = None
+        self.generation = 0
+        thread = threading.Thread(target=self._run, name="preview-worker")
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, job):
+        """Zadá novou úlohu; dosud nezačatá úloha se nahradí, běžící se zruší."""
+        with self._condition:
+            self.generation += 1
+            self._pending = (self.generation, job)
+            self._condition.notify()
+            return self.generation
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def _run(self):
+        # Import až ve vlákně pracovníka: start GUI na něj nečeká a zpracování
+        # obrazu se tím zároveň načte dřív, než přijde první úloha.
+        from processing import ProcessingCancelled
+
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                generation, job = self._pending
+                self._pending = None
+
+            is_stale = lambda: not self.is_current(generation)
+            steps = [(self._compute, self._deliver)]
+            if self._follow_up is not None:
+                steps.append((self._follow_up, self._deliver_follow_up))
+            for compute, deliver in steps:
+                try:
+                    result = compute(job, is_stale)
+                except ProcessingCancelled:
+                    break
+                except Exception:
+                    traceback.print_exc()
+                    break
+                if is_stale():
+                    break
+                deliver(generation, result)
@@ -1,34 +1,58 @@
-import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 
+from instrumentation import Tracer
 
-def process_image(
-    pil_image: Image.Image,
-    contrast: float,
-    brightness: float,
-    smoothing: float,
-    invert_colors: bool,
-    use_threshold: bool,
-    threshold_level: int,
-    dilate: int,
-    erode: int,
-    noise_reduction: int,
-    use_stroke: bool,
-    stroke_thickness: int,
-    use_artistic_smoothing: bool,
-    artistic_smoothing_strength: float,
-) -> Image.Image:
+# OpenCV se importuje až v etapách, které ho používají, aby import modulu
+# (start GUI, knihovní použití `process_image`) nečekal na načtení cv2.
+
+
+# Režimy PIL s více než 8 bity na pixel (16-bitové PNG/TIFF, 32-bitová čísla).
+HIGH_DEPTH_MODES = ("I;16", "I;16L", "I;16B", "I;16N", "I", "F")
+
+
+class ProcessingCancelled(Exception):
+    """Vyvoláno pipeline, když je výpočet zrušen (např. novější náhled)."""
+
+
+def load_image_file(path) -> Image.Image:
     """
-    Aplikuje sekvenci operací pro zpracování obrazu na vstupní obrázek.
-    Vrací zpracovaný obrázek ve formátu PIL.
+    Načte obrázek ze souboru, otočí ho podle EXIF orientace a průhledné pozadí
+    (RGBA) nahradí bílou barvou. Sdíleno GUI i dávkovým režimem.
+    Obrázky s vyšší bitovou hloubkou (16-bitové PNG/TIFF, float TIFF) se vrací
+    v režimu "F" ve stupnici 0..255 bez zaokrouhlení, viz `to_float_image`.
+    """
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode in HIGH_DEPTH_MODES:
+            return to_float_image(img)
+        if img.mode == "RGBA":
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            bg.paste(img, mask=img.split()[3])
+            return bg
+        return img.copy()
+
+
+def to_float_image(pil_image: Image.Image) -> Image.Image:
     """
-    # Zkontroluje, zda byl poskytnut platný obrázek, jinak vrátí prázdný obrázek.
-    if not pil_image:
-        return Image.new("L", (100, 100), 0)
+    Převede obrázek s vyšší bitovou hloubkou na režim "F" ve stejné stupnici
+    jako 8 bitů (0..255), aby parametry zpracování (práh, kontrast) platily beze
+    změny. Celočíselné režimy se berou jako 16bitové (0..65535), plovoucí hodnoty
+    (hloubkové mapy v libovolných jednotkách) se roztáhnou z rozsahu min..max.
+    """
+    arr = np.asarray(pil_image, dtype=np.float32)
+    if pil_image.mode == "F":
+        low, high = float(arr.min()), float(arr.max())
+        arr = (arr - low) * (255.0 / (high - low)) if high > low else arr * 0.0
+    else:
+        arr = arr * np.float32(255.0 / 65535.0)
+    return Image.fromarray(arr.astype(np.float32))
+
 
-    # Převede obrázek PIL na 8-bitové pole NumPy v odstínech šedi.
-    arr = np.array(pil_image.convert("L"), dtype=np.uint8)
+def _stage_tone(arr: np.ndarray, brightness: float, contrast: float) -> np.ndarray:
+    """Tonální úpravy (jas a kontrast)."""
+    if brightness == 1.0 and contrast == 1.0:
+        return arr
 
     # Provede tonální úpravy na 32-bitovém poli s plovoucí desetinnou čárkou, aby se zabránilo ořezání hodnot.
     arr_float = arr.astype(np.float32)
@@ -41,12 +65,32 @@ def process_image(
     if contrast != 1.0:
         arr_float = 128 + contrast * (arr_float - 128)
 
-    # Ořízne hodnoty zpět do platného 8-bitového rozsahu (0-255) a převede datový typ.
-    arr = np.clip(arr_float, 0, 255).astype(np.uint8)
+    # Ořízne hodnoty zpět do platného rozsahu (0-255); 8-bitový vstup převede zpět.
+    arr_float = np.clip(arr_float, 0, 255)
+    return arr_float if arr.dtype == np.float32 else arr_float.astype(np.uint8)
+
+
+def _stage_threshold(
+    arr: np.ndarray, use_threshold: bool, threshold_level: int
+) -> np.ndarray:
+    """Binární prahování, pokud je povoleno."""
+    import cv2
 
-    # Aplikuje binární prahování, pokud je povoleno.
     if use_threshold:
         _, arr = cv2.threshold(arr, threshold_level, 255, cv2.THRESH_BINARY)
+    return arr
+
+
+def _stage_shape(
+    arr: np.ndarray,
+    use_threshold: bool,
+    use_stroke: bool,
+    stroke_thickness: int,
+    dilate: int,
+    erode: int,
+) -> np.ndarray:
+    """Obtažení kontur, nebo morfologické operace (dilatace a eroze)."""
+    import cv2
 
     # Vzájemně se vylučující blok: buď se aplikuje obtažení, nebo morfologické operace.
     if use_stroke:
@@ -54,6 +98,8 @@ def process_image(
         binary_src = (
             arr if use_threshold else cv2.threshold(arr, 127, 255, cv2.THRESH_BINARY)[1]
         )
+        # findContours pracuje jen s 8-bitovým obrázkem.
+        binary_src = binary_src.astype(np.uint8, copy=False)
         # Najde kontury v binárním obrázku.
         contours, _ = cv2.findContours(
             binary_src, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
@@ -70,28 +116,359 @@ def process_image(
         if erode > 0:
             kernel_e = np.ones((2 * erode + 1, 2 * erode + 1), np.uint8)
             arr = cv2.erode(arr, kernel_e, iterations=1)
+    return arr
+
+
+def _stage_noise(arr: np.ndarray, noise_reduction: int) -> np.ndarray:
+    """
+    Mediánový filtr pro odstranění šumu typu "sůl a pepř". OpenCV umí medián
+    float32 jen s jádrem 3 nebo 5; větší jádra se v přesném režimu počítají
+    na 8 bitech (medián stejně vytváří ploché oblasti).
+    """
+    import cv2
 
-    # Aplikuje mediánový filtr pro odstranění šumu typu "sůl a pepř".
     if noise_reduction > 0:
         noise_k_size = 2 * noise_reduction + 1
-        arr = cv2.medianBlur(arr, noise_k_size)
+        if arr.dtype == np.float32 and noise_k_size > 5:
+            arr_8bit = np.rint(arr).astype(np.uint8)
+            arr = cv2.medianBlur(arr_8bit, noise_k_size).astype(np.float32)
+        else:
+            arr = cv2.medianBlur(arr, noise_k_size)
+    return arr
+
+
+def _stage_gaussian(arr: np.ndarray, smoothing: float) -> np.ndarray:
+    """Standardní Gaussovský filtr pro jemné rozmazání."""
+    import cv2
 
-    # Aplikuje standardní Gaussovský filtr pro jemné rozmazání.
     if smoothing > 0.0:
         k_size = int(smoothing * 2) * 2 + 1
         arr = cv2.GaussianBlur(arr, (k_size, k_size), 0)
+    return arr
+
+
+# Průměr okolí pixelu bilaterálního filtru; 9 je dobrá výchozí hodnota.
+BILATERAL_DIAMETER = 9
+# Rychlý guided filter: poloměr okna odpovídající bilaterálnímu průměru a faktor
+# podvzorkování, ve kterém se počítají lineární koeficienty (viz `_guided_filter`).
+GUIDED_RADIUS = 4
+GUIDED_SUBSAMPLE = 2
+SMOOTHING_ENGINES = ("bilateral", "guided")
+
+
+def _guided_filter(arr: np.ndarray, radius: int, eps: float) -> np.ndarray:
+    """
+    Rychlý samonaváděný guided filter (He a kol.): v každém okně se obraz
+    nahradí lineární funkcí sebe sama, q = a * I + b, kde a = var / (var + eps).
+    V plochých oblastech (var << eps) vyhlazuje, na hranách (var >> eps) je
+    zachová. Koeficienty se počítají box filtry na podvzorkovaném obrazu,
+    takže cena nezávisí na síle vyhlazení a je zlomkem bilaterálního filtru.
+    Obraz se před podvzorkováním doplní opakováním okraje na násobek
+    GUIDED_SUBSAMPLE, takže podvzorkovaná mřížka začíná v levém horním rohu
+    a výřez zarovnaný na tuto mřížku dává (kromě okraje `processing_halo`)
+    stejný výsledek jako celý obrázek.
+    """
+    import cv2
+
+    src = arr.astype(np.float32)
+    height, width = src.shape
+    pad_y, pad_x = -height % GUIDED_SUBSAMPLE, -width % GUIDED_SUBSAMPLE
+    padded = cv2.copyMakeBorder(src, 0, pad_y, 0, pad_x, cv2.BORDER_REPLICATE)
+    size = (width + pad_x, height + pad_y)
+    small_size = (size[0] // GUIDED_SUBSAMPLE, size[1] // GUIDED_SUBSAMPLE)
+    small = cv2.resize(padded, small_size, interpolation=cv2.INTER_AREA)
+    r = max(1, radius // GUIDED_SUBSAMPLE)
+    ksize = (2 * r + 1, 2 * r + 1)
+
+    mean = cv2.boxFilter(small, -1, ksize)
+    var = cv2.sqrBoxFilter(small, -1, ksize)
+    var -= mean * mean
+    a = var / (var + np.float32(eps))
+    mean -= a * mean  # b = mean - a * mean
+    a = cv2.resize(cv2.boxFilter(a, -1, ksize), size)[:height, :width]
+    b = cv2.resize(cv2.boxFilter(mean, -1, ksize), size)[:height, :width]
+
+    a *= src
+    a += b
+    if arr.dtype == np.uint8:
+        # a, b i vstup jsou nezáporné, takže convertScaleAbs jen zaokrouhlí
+        # a ořízne na 0..255 (v jednom průchodu).
+        return cv2.convertScaleAbs(a)
+    return a
+
+
+def _stage_bilateral(
+    arr: np.ndarray,
+    use_artistic_smoothing: bool,
+    artistic_smoothing_strength: float,
+    artistic_smoothing_engine: str = "bilateral",
+) -> np.ndarray:
+    """
+    Vyhlazení, které zachovává hrany: bilaterální filtr, nebo rychlý guided
+    filtr (`artistic_smoothing_engine="guided"`) s podobným výsledkem.
+    """
+    import cv2
 
-    # Aplikuje bilaterální filtr pro inteligentní vyhlazení, které zachovává hrany.
+    if artistic_smoothing_engine not in SMOOTHING_ENGINES:
+        raise ValueError(f"Neznámý typ vyhlazení: {artistic_smoothing_engine}")
     if use_artistic_smoothing and artistic_smoothing_strength > 0:
         # Převede hodnotu posuvníku (0-100) na parametr sigma pro filtr.
         sigma_val = int(artistic_smoothing_strength * 1.5)
-        # Průměr okolí pixelu; 9 je dobrá výchozí hodnota.
-        diameter = 9
-        arr = cv2.bilateralFilter(arr, diameter, sigma_val, sigma_val)
+        if artistic_smoothing_engine == "guided":
+            # eps odpovídá rozptylu jasu, od kterého se rozdíl bere jako hrana.
+            arr = _guided_filter(arr, GUIDED_RADIUS, (sigma_val / 2.0) ** 2)
+        else:
+            arr = cv2.bilateralFilter(arr, BILATERAL_DIAMETER, sigma_val, sigma_val)
+    return arr
 
-    # Invertuje hodnoty jasu, pokud je povoleno.
+
+def _stage_invert(arr: np.ndarray, invert_colors: bool) -> np.ndarray:
+    """Inverze hodnot jasu, pokud je povolena."""
     if invert_colors:
         arr = 255 - arr
+    return arr
+
+
+# Pořadí etap zpracování a názvy parametrů, na kterých každá etapa závisí.
+# Etapa se přepočítá jen tehdy, když se změní její parametry nebo kterákoliv předchozí etapa.
+PIPELINE_STAGES = (
+    ("tone", _stage_tone, ("brightness", "contrast")),
+    ("threshold", _stage_threshold, ("use_threshold", "threshold_level")),
+    (
+        "shape",
+        _stage_shape,
+        ("use_threshold", "use_stroke", "stroke_thickness", "dilate", "erode"),
+    ),
+    ("noise", _stage_noise, ("noise_reduction",)),
+    ("gaussian", _stage_gaussian, ("smoothing",)),
+    (
+        "bilateral",
+        _stage_bilateral,
+        (
+            "use_artistic_smoothing",
+            "artistic_smoothing_strength",
+            "artistic_smoothing_engine",
+        ),
+    ),
+    ("invert", _stage_invert, ("invert_colors",)),
+)
+
+
+def scale_processing_params(params: dict, scale: float) -> dict:
+    """
+    Přepočítá prostorové parametry (velikosti jader v pixelech) pro zpracování
+    obrázku zmenšeného v poměru `scale`, aby zmenšený náhled odpovídal výsledku
+    v plném rozlišení.
+    """
+    scaled = dict(params)
+    if scale == 1.0:
+        return scaled
+    for name in ("dilate", "erode", "noise_reduction"):
+        scaled[name] = int(round(params[name] * scale))
+    scaled["stroke_thickness"] = max(1, int(round(params["stroke_thickness"] * scale)))
+    scaled["smoothing"] = params["smoothing"] * scale
+    return scaled
+
+
+def processing_halo(params: dict) -> int:
+    """
+    Vrátí dosah (v pixelech), do kterého může okolí ovlivnit výsledný pixel.
+    Výřez zvětšený o tento okraj se zpracuje bez artefaktů na hranách.
+    """
+    halo = 0
+    if params["use_stroke"]:
+        halo += int(params["stroke_thickness"])
+    else:
+        halo += int(params["dilate"]) + int(params["erode"])
+    halo += int(params["noise_reduction"])
+    if params["smoothing"] > 0.0:
+        halo += int(params["smoothing"] * 2) + 1
+    if params["use_artistic_smoothing"] and params["artistic_smoothing_strength"] > 0:
+        if params.get("artistic_smoothing_engine", "bilateral") == "guided":
+            # Dva box filtry za sebou, zpětné zvětšení (jeden podvzorkovaný pixel)
+            # a doplnění okraje výřezu na násobek podvzorkování.
+            halo += 2 * GUIDED_RADIUS + 2 * GUIDED_SUBSAMPLE
+        else:
+            halo += BILATERAL_DIAMETER // 2
+    return halo
+
+
+class ProcessingPipeline:
+    """
+    Zpracování obrazu jako řetězec etap s pamětí mezivýsledků.
+    Výstup každé etapy se uloží spolu s jejími parametry; při dalším volání se
+    přepočítají jen etapy od první změněné dál (např. posun posuvníku vyhlazení
+    přepočítá jen Gaussův filtr a následující etapy). Mezivýsledky se nikdy
+    nemění na místě, etapy bez účinku vrací vstupní pole beze změny.
+    """
+
+    def __init__(self):
+        self._source = None
+        self._gray = None
+        self._high_precision = None
+        self._cache = []
+
+    def clear(self):
+        """Zahodí všechny uložené mezivýsledky."""
+        self._source = None
+        self._gray = None
+        self._high_precision = None
+        self._cache = []
+
+    def run(
+        self,
+        pil_image: Image.Image,
+        cancel_check=None,
+        tracer: Tracer = None,
+        high_precision: bool = False,
+        **params,
+    ) -> Image.Image:
+        """
+        Zpracuje obrázek s danými parametry (stejnými jako u `process_image`).
+        Pokud `cancel_check()` vrátí True, výpočet se před další etapou přeruší
+        výjimkou `ProcessingCancelled`; dosud spočítané etapy zůstanou uložené.
+        Volitelný `tracer` zaznamená dobu a velikost každé přepočítané etapy.
+
+        S `high_precision` (a vždy u obrázků v režimu "F", viz `load_image_file`)
+        běží etapy na float32 ve stupnici 0..255 a výsledkem je obrázek "F";
+        jinak na 8 bitech a výsledkem je obrázek "L".
+        """
+        if not pil_image:
+            return Image.new("L", (100, 100), 0)
+        arr = self.run_array(pil_image, cancel_check, tracer, high_precision, **params)
+        # Převede finální pole NumPy zpět na obrázkový formát PIL.
+        return Image.fromarray(arr)
+
+    def run_array(
+        self,
+        source,
+        cancel_check=None,
+        tracer: Tracer = None,
+        high_precision: bool = False,
+        **params,
+    ) -> np.ndarray:
+        """
+        Jako `run`, ale zdrojem může být i 2D pole (viz `process_array`)
+        a výsledkem je pole uint8, nebo float32 ve stupnici 0..255.
+        """
+        tracer = tracer or Tracer()
+        # Stejná výchozí hodnota jako u `process_image`.
+        params.setdefault("artistic_smoothing_engine", "bilateral")
+        if isinstance(source, np.ndarray):
+            high_precision = high_precision or source.dtype != np.uint8
+            to_gray, pixels = _gray_array, source.size
+        else:
+            high_precision = high_precision or source.mode in HIGH_DEPTH_MODES
+            to_gray, pixels = image_to_array, source.width * source.height
+
+        # Nový zdroj (např. po aplikaci masky) nebo změna přesnosti zneplatní
+        # všechny etapy.
+        if source is not self._source or high_precision != self._high_precision:
+            with tracer.stage("process.grayscale", pixels=pixels):
+                self._source = source
+                self._high_precision = high_precision
+                self._gray = to_gray(source, high_precision)
+                self._cache = []
+
+        arr = self._gray
+        for i, (name, stage, names) in enumerate(PIPELINE_STAGES):
+            key = tuple(params[n] for n in names)
+            if i < len(self._cache) and self._cache[i][0] == key:
+                arr = self._cache[i][1]
+                tracer.event(f"process.{name}", cached=True)
+                continue
+            del self._cache[i:]
+            if cancel_check is not None and cancel_check():
+                raise ProcessingCancelled()
+            with tracer.stage(f"process.{name}", pixels=arr.size):
+                arr = stage(arr, *key)
+            self._cache.append((key, arr))
+        return arr
+
+
+def image_to_array(pil_image: Image.Image, high_precision: bool = False) -> np.ndarray:
+    """
+    Převede PIL obrázek na 2D pole v odstínech šedi: uint8, nebo float32
+    ve stupnici 0..255 (při `high_precision` a u obrázků s vyšší bitovou hloubkou).
+    """
+    if pil_image.mode == "F":
+        return np.array(pil_image, dtype=np.float32)
+    if pil_image.mode in HIGH_DEPTH_MODES:
+        return np.array(to_float_image(pil_image), dtype=np.float32)
+    if high_precision:
+        return np.array(pil_image.convert("L"), dtype=np.float32)
+    return np.array(pil_image.convert("L"), dtype=np.uint8)
 
-    # Převede finální pole NumPy zpět na obrázkový formát PIL.
-    return Image.fromarray(arr)
+
+def _gray_array(arr: np.ndarray, high_precision: bool) -> np.ndarray:
+    """
+    Připraví 2D pole jako vstup etap. Pole uint8 (a float32 ve stupnici 0..255)
+    se použije bez kopie, uint16 se přepočítá na 0..255, ostatní typy na float32.
+    """
+    if arr.ndim != 2:
+        raise ValueError("Zpracovat lze jen 2D pole (obrázek v odstínech šedi).")
+    if arr.dtype == np.uint8 and not high_precision:
+        return arr
+    if arr.dtype == np.uint16:
+        return arr.astype(np.float32) * np.float32(255.0 / 65535.0)
+    return arr.astype(np.float32, copy=False)
+
+
+def process_array(
+    array: np.ndarray, tracer: Tracer = None, cancel_check=None, **params
+) -> np.ndarray:
+    """
+    Varianta `process_image` bez PIL: zpracuje 2D pole (uint8, uint16 nebo
+    float32 ve stupnici 0..255) se stejnými parametry a vrátí pole uint8, nebo
+    float32 (při `high_precision` či jiném vstupu než uint8). Etapy bez účinku
+    pole nekopírují, výsledek proto může sdílet paměť se vstupem; žádná etapa
+    pole nemění na místě. `cancel_check` viz `ProcessingPipeline.run`.
+    """
+    return ProcessingPipeline().run_array(
+        array, cancel_check=cancel_check, tracer=tracer, **params
+    )
+
+
+def process_image(
+    pil_image: Image.Image,
+    contrast: float,
+    brightness: float,
+    smoothing: float,
+    invert_colors: bool,
+    use_threshold: bool,
+    threshold_level: int,
+    dilate: int,
+    erode: int,
+    noise_reduction: int,
+    use_stroke: bool,
+    stroke_thickness: int,
+    use_artistic_smoothing: bool,
+    artistic_smoothing_strength: float,
+    artistic_smoothing_engine: str = "bilateral",
+    high_precision: bool = False,
+    tracer: Tracer = None,
+) -> Image.Image:
+    """
+    Aplikuje sekvenci operací pro zpracování obrazu na vstupní obrázek.
+    Vrací zpracovaný obrázek ve formátu PIL ("L", nebo "F" při `high_precision`
+    či vstupu s vyšší bitovou hloubkou).
+    """
+    return ProcessingPipeline().run(
+        pil_image,
+        tracer=tracer,
+        high_precision=high_precision,
+        contrast=contrast,
+        brightness=brightness,
+        smoothing=smoothing,
+        invert_colors=invert_colors,
+        use_threshold=use_threshold,
+        threshold_level=threshold_level,
+        dilate=dilate,
+        erode=erode,
+        noise_reduction=noise_reduction,
+        use_stroke=use_stroke,
+        stroke_thickness=stroke_thickness,
+        use_artistic_smoothing=use_artistic_smoothing,
+        artistic_smoothing_strength=artistic_smoothing_strength,
+        artistic_smoothing_engine=artistic_smoothing_engine,
+    )
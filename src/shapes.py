@@ -0,0 +1,85 @@
+# src/shapes.py
+
+# Tvary masky pro ořezový nástroj GUI. Šestiúhelník a srdce jsou předpočítané
+# jednotkové šablony, které se při tažení myší jen posunou, zvětší (a u šestiúhelníku
+# otočí) jednou maticovou operací. Rasterizace masky probíhá přes cv2.fillPoly.
+
+from functools import lru_cache
+
+import numpy as np
+
+# Počet bodů obrysu srdce.
+HEART_POINTS = 100
+# Podpixelová přesnost rasterizace (cv2.fillPoly s `shift` bity zlomku).
+MASK_SHIFT = 4
+
+
+def _hexagon_template():
+    angles = np.pi / 3 * np.arange(6)
+    return np.column_stack((np.cos(angles), np.sin(angles)))
+
+
+def _heart_template():
+    t = 2 * np.pi * np.arange(HEART_POINTS) / HEART_POINTS
+    x = 16 * np.sin(t) ** 3 / 13
+    y = -(13 * np.cos(t) - 5 * np.cos(2 * t) - 2 * np.cos(3 * t) - np.cos(4 * t)) / 13
+    return np.column_stack((x, y))
+
+
+# Jednotkové šablony (poloměr 1, střed v počátku).
+SHAPE_TEMPLATES = {"Hexagon": _hexagon_template(), "Heart": _heart_template()}
+
+
+@lru_cache(maxsize=16)
+def _shape_points(mode, points):
+    if mode == "Rectangle" and len(points) >= 2:
+        (x1, y1), (x2, y2) = points[0], points[-1]
+        return np.array([(x1, y1), (x2, y1), (x2, y2), (x1, y2)], dtype=np.float64)
+    if mode in SHAPE_TEMPLATES and len(points) >= 2:
+        center = np.array(points[0], dtype=np.float64)
+        dx, dy = np.subtract(points[-1], points[0])
+        if dx == 0 and dy == 0:
+            return np.empty((0, 2))
+        if mode == "Hexagon":
+            # Otočení o úhel tažení a zvětšení na poloměr v jedné matici.
+            transform = np.array([[dx, dy], [-dy, dx]])
+        else:
+            # Srdce se neotáčí, jen zvětšuje.
+            transform = np.hypot(dx, dy) * np.eye(2)
+        return SHAPE_TEMPLATES[mode] @ transform + center
+    return np.array(points, dtype=np.float64).reshape(-1, 2)
+
+
+def shape_points(mode, points):
+    """
+    Vrátí obrys tvaru `mode` ("Rectangle", "Polygon", "Hexagon", "Heart") jako
+    pole (N, 2) v souřadnicích obrázku. U obdélníku a tvarů ze šablony je první
+    bod roh/střed a poslední bod aktuální pozice myši. Výsledky posledních
+    volání se pamatují (opakované překreslení bez pohybu myši je zdarma),
+    vrácené pole proto nelze měnit.
+    """
+    result = _shape_points(mode, tuple(map(tuple, points)))
+    result.flags.writeable = False
+    return result
+
+
+def to_canvas(points, offset_x, offset_y, zoom):
+    """Převede body obrázku na plochý seznam souřadnic plátna [x0, y0, x1, ...]."""
+    return ((points - (offset_x, offset_y)) * zoom).ravel().tolist()
+
+
+def rasterize_mask(points, size, invert=False):
+    """
+    Vyplní polygon do masky uint8 (255 uvnitř) o velikosti `size` (šířka, výška).
+    Při `invert` je maska opačná (255 vně polygonu).
+    """
+    import cv2
+
+    width, height = size
+    mask = np.zeros((height, width), dtype=np.uint8)
+    # Souřadnice (celé číslo = střed pixelu) jako pevná řádová čárka s MASK_SHIFT bity.
+    scaled = np.rint(np.asarray(points) * (1 << MASK_SHIFT)).astype(np.int32)
+    cv2.fillPoly(mask, [scaled], 255, lineType=cv2.LINE_8, shift=MASK_SHIFT)
+    if invert:
+        np.bitwise_not(mask, out=mask)
+    return mask
@@ -1,122 +1,771 @@
+import inspect
+import os
 import numpy as np
-import pyvista as pv
+import threading
+import time
 import traceback
-from PIL import Image, ImageOps
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from adaptive_mesh import (
+    build_adaptive_relief,
+    build_adaptive_solid,
+    relief_triangle_bound,
+)
+from export_cache import cache_key
+from heightmap_file import Heightmap
+from heightmap_mesh import (
+    build_solid_mesh,
+    build_solid_strip,
+    mask_quads,
+    masked_triangles,
+    solid_strip_triangles,
+    strip_ranges,
+    strip_rows_for_width,
+)
+from instrumentation import Tracer
+from mesh_writer import (
+    STL_HEADER_SIZE,
+    STL_RECORD_DTYPE,
+    StlStreamWriter,
+    mesh_format,
+    triangles_to_records,
+    write_mesh,
+)
+from processing import HIGH_DEPTH_MODES, ProcessingCancelled, to_float_image
 
-# Hlavní funkce pro konverzi obrázku na STL.
-# Vstupem je zpracovaný PIL obrázek a slovník s parametry.
-# Výstupem je buď True (úspěch), nebo objekt výjimky (chyba).
+
+# Výchozí maximální rozměr obrázku (v pixelech) pro generování sítě.
+DEFAULT_MAX_DIMENSION = 800
+# Doporučená velikost detailu (mm na vzorek mřížky) pro `feature_size_mm`:
+# zhruba polovina průměru běžné trysky 0,4 mm, jemnější detail tiskárna nevytiskne.
+DEFAULT_FEATURE_SIZE_MM = 0.2
+# Od tohoto počtu pixelů se pevný model automaticky exportuje po pásech (streamovaně).
+STREAMING_PIXEL_THRESHOLD = 2048 * 2048
+# Výchozí přibližná tolerance (mm) adaptivní triangulace pro export samotného reliéfu.
+DEFAULT_RELIEF_MAX_ERROR = 0.05
+# Šířka rámečku podstavy (mm) při volbě "cutting margin".
+CUTTING_MARGIN_MM = 1.0
+# Nejmenší výška pásu (v řádcích) při paralelním generování; menší pásy by
+# převážila režie vláken.
+MIN_PARALLEL_STRIP_ROWS = 16
+# Hustota filamentu (g/cm³) pro odhad spotřeby materiálu; výchozí je PLA.
+FILAMENT_DENSITY_G_CM3 = 1.24
+# Orientační cena jednotek práce exportu (ns na jednotku, naměřeno na jednom jádře):
+# sestavení trojúhelníku plné mřížky, pixel adaptivní triangulace a zápis
+# trojúhelníku podle formátu. Určuje jen poměr etap na progress baru; odhad
+# zbývajícího času se počítá z propustnosti naměřené za běhu.
+WORK_COST_NS = {
+    "mesh": 25,
+    "adaptive": 1000,
+    "stl": 300,
+    "stl.gz": 1000,
+    "ascii": 7000,
+    "3mf": 1200,
+    "ply": 25,
+}
 
 
-def image_to_stl(processed_pil_image, stl_path, params, progress_callback):
+class ExportProgress:
     """
-    Konvertuje zpracovaný obrázek na optimalizovaný STL soubor pomocí PyVista.
-    Tato verze používá robustní architekturu s lineární přípravou dat.
+    Průběh exportu úměrný odvedené práci. Práce se plánuje (`expect`)
+    a odvádí (`advance`, `part`) v jednotkách `WORK_COST_NS`; po každém kroku
+    se volá `callback(procenta, zbývající_s)`, kde zbývající čas vychází
+    z dosavadní propustnosti (None, dokud není nic hotovo). Callback s jediným
+    pozičním parametrem dostane jen `callback(procenta)`. Před každým
+    hlášením se ověří `cancel_check()` a při True vyvolá `ProcessingCancelled`.
     """
+
+    def __init__(self, callback, cancel_check=None):
+        self.callback = callback
+        self.with_eta = _accepts_eta(callback)
+        self.cancel_check = cancel_check
+        self.total = 0.0
+        self.done = 0.0
+        self.percent = 0.0
+        self.started = time.perf_counter()
+
+    def check(self):
+        """Přeruší export výjimkou `ProcessingCancelled`, pokud byl zrušen."""
+        if self.cancel_check is not None and self.cancel_check():
+            raise ProcessingCancelled()
+
+    def expect(self, work):
+        self.total += work
+
+    def advance(self, work):
+        self.done += work
+        self.report()
+
+    def part(self, work):
+        """
+        Vrátí funkci `(hotovo, celkem)` pro postupné hlášení části práce `work`,
+        např. zápisu souboru po dávkách (viz `mesh_writer.write_mesh`).
+        """
+        start = None
+
+        def update(done, total):
+            nonlocal start
+            # Začátek části se určí až při prvním hlášení: komprese streamovaného
+            # STL se hlásí až po zápisu všech pásů.
+            if start is None:
+                start = self.done
+            self.done = start + work * done / max(total, 1)
+            self.report()
+
+        return update
+
+    def report(self):
+        self.check()
+        # Upřesnění plánu (např. po adaptivní triangulaci) průběh nevrací zpět.
+        fraction = min(1.0, self.done / self.total) if self.total else 0.0
+        self.percent = max(self.percent, 100.0 * fraction)
+        eta = None
+        if fraction > 0:
+            elapsed = time.perf_counter() - self.started
+            eta = elapsed * (1.0 - fraction) / fraction
+        self._notify(eta)
+
+    def finish(self):
+        self.percent = 100.0
+        self._notify(0.0)
+
+    def _notify(self, eta):
+        if self.with_eta:
+            self.callback(self.percent, eta)
+        else:
+            self.callback(self.percent)
+
+
+def _accepts_eta(callback):
+    """Zjistí, zda `callback` přijme druhý poziční argument (zbývající čas)."""
     try:
-        # --- KROK 1: PŘÍPRAVA VSTUPNÍCH DAT ---
-        progress_callback(5)
-        # Nastavení maximálního rozměru obrázku pro zpracování.
-        MAX_DIMENSION = 800
-        img = processed_pil_image.copy()
-
-        # Zmenšení obrázku, pokud přesahuje maximální rozměr, pro optimalizaci výkonu.
-        if img.width > MAX_DIMENSION or img.height > MAX_DIMENSION:
-            img.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS)
-
-        # Aplikace zrcadlení, pokud je vyžadováno.
-        if params.get("mirror_output", False):
-            img = ImageOps.mirror(img)
-
-        # Převod obrázku na NumPy pole a normalizace hodnot jasu (0-255) na rozsah (0.0-1.0).
-        pixel_data = np.array(img).astype(np.float32)
-        # Základní logika je nastavena tak, že tmavší barva znamená vyšší bod (1.0 - ...).
-        normalized_heights = 1.0 - (pixel_data / 255.0)
-
-        img_width, img_height = img.size
-        # Kontrola, zda obrázek není příliš malý pro generování.
-        if img_width < 2 or img_height < 2:
-            raise ValueError("Obrázek je pro konverzi příliš malý.")
-
-        # Načtení parametrů modelu (cílové rozměry v mm) ze slovníku `params`.
-        model_width_mm = params["model_width_mm"]
-        base_height = params["base_height"]
-        model_height = params["model_height"]
-        # Výpočet měřítka pro převod pixelových souřadnic na reálné jednotky (milimetry).
-        scale_factor = model_width_mm / img_width
-
-        progress_callback(20)
-
-        # Zpracování speciálního případu pro export pouze 2.5D povrchu (bez tloušťky).
-
-        if params.get("export_relief_only", False):
-            print("Exportuji pouze 2.5D reliéf bez tloušťky.")
-
-            # Vytvoření mračna bodů a následně 2D povrchu pomocí Delaunayovy triangulace.
-
-            x = np.arange(img_width) * scale_factor
-            y = np.arange(img_height) * scale_factor
-            xx, yy = np.meshgrid(x, y)
-            zz = base_height + (normalized_heights * model_height)
-            points = np.vstack((xx.ravel(), yy.ravel(), zz.ravel())).T
-            surface = pv.PolyData(points).delaunay_2d()
-            progress_callback(70)
-            # Zjednodušení (decimace) 2D povrchu pro snížení počtu polygonů.
-            simplified_surface = surface.decimate(0.98)
-            # Uložení zjednodušeného povrchu a ukončení funkce.
-            simplified_surface.save(stl_path, binary=True)
-            progress_callback(100)
+        parameters = inspect.signature(callback).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    positional = 0
+    for parameter in parameters:
+        if parameter.kind is parameter.VAR_POSITIONAL:
             return True
+        if parameter.kind in (
+            parameter.POSITIONAL_ONLY,
+            parameter.POSITIONAL_OR_KEYWORD,
+        ):
+            positional += 1
+    return positional >= 2
+
+
+def _heights_mm(pixel_rows, base_height, model_height):
+    """
+    Převede hodnoty jasu 0..255 (uint8, nebo float32 v přesném režimu) na výšky
+    v mm (tmavší barva = vyšší bod).
+    """
+    # base + (1 - p/255) * height, počítáno na místě v jediném poli float32.
+    heights = pixel_rows.astype(np.float32)
+    heights *= np.float32(-model_height / 255.0)
+    heights += np.float32(base_height + model_height)
+    return heights
 
-        # --- LOGIKA PRO VŠECHNY PEVNÉ MODELY ---
-        # Vytvoření mřížky XY souřadnic pro horní (reliéf) a spodní (podstava) plochu.
 
-        x = np.arange(img_width) * scale_factor
-        y = np.arange(img_height) * scale_factor
+def mesh_grid_size(width, height, params):
+    """
+    Vrátí rozměry mřížky sítě (šířka, výška) ve vzorcích pro výškovou mapu
+    width x height. S `feature_size_mm` odpovídá jeden vzorek tomuto detailu
+    na modelu širokém `model_width_mm` (malé modely tak nedostanou zbytečně
+    jemnou síť a velké nepřijdou o detail); `max_dimension` je horní mez
+    delší strany (0 nebo None bez omezení). Mapa se nikdy nezvětšuje.
+    """
+    ratio = 1.0
+    max_dimension = params.get("max_dimension", DEFAULT_MAX_DIMENSION)
+    if max_dimension:
+        ratio = min(ratio, max_dimension / max(width, height))
+    feature_size = params.get("feature_size_mm")
+    if feature_size:
+        ratio = min(ratio, params["model_width_mm"] / feature_size / width)
+    if ratio >= 1.0:
+        return width, height
+    return max(2, round(width * ratio)), max(2, round(height * ratio))
+
 
-        # Pokud je aktivní volba "cutting margin", spodní mřížka se rozšíří o daný okraj.
+def _prepare_image(img, params, mask=None):
+    """
+    Připraví zpracovaný PIL obrázek: převod na pole a maska (`mask` v režimu "L",
+    nebo alfa kanál obrázku "LA"), dál jako `_prepare_array`. Obrázek "F"
+    z přesného režimu zpracování si zachová výšky bez zaokrouhlení na 256 úrovní.
+    """
+    values, mask = _image_values(img, mask)
+    return _prepare_array(values, params, mask)
 
-        if params.get("use_cutting_margin", False):
-            margin = 1.0
-            x = np.linspace(np.min(x) - margin, np.max(x) + margin, img_width)
-            y = np.linspace(np.min(y) - margin, np.max(y) + margin, img_height)
 
-        xx, yy = np.meshgrid(x, y)
-        # Výpočet Z souřadnic pro horní plochu na základě výškové mapy.
-        zz_top = base_height + (normalized_heights * model_height)
-        # Nastavení Z souřadnic pro spodní plochu na konstantní nulu.
-        zz_base = np.zeros_like(zz_top)
-
-        # Vytvoření 3D objemové mřížky (StructuredGrid) ze dvou vrstev bodů (spodní a horní).
-        grid = pv.StructuredGrid()
-        grid.dimensions = [img_width, img_height, 2]
-
-        bottom_points = np.vstack((xx.ravel(), yy.ravel(), zz_base.ravel())).T
-        top_points = np.vstack((xx.ravel(), yy.ravel(), zz_top.ravel())).T
-        grid.points = np.vstack([bottom_points, top_points])
-        progress_callback(70)
-
-        # Extrakce vnějšího povrchu z objemové mřížky. Tímto krokem vznikne vodotěsné 3D těleso.
-        print("Vytvářím 3D těleso z objemové mřížky...")
-        # Převod povrchu na síť trojúhelníků (pojistka pro maximální kompatibilitu).
-        solid_mesh = grid.extract_surface().triangulate()
-        print(f"Model vytvořen s {solid_mesh.n_cells} trojúhelníky.")
-
-        progress_callback(90)
-        print("Ukládám finální STL soubor...")
-
-        # Finální vyčištění geometrie (sloučení duplicitních bodů) a uložení do binárního STL souboru.
-        solid_mesh = solid_mesh.clean()
-        if solid_mesh is None:
-            raise ValueError("Chyba: Výsledná síť je None a nelze ji uložit jako STL.")
-        solid_mesh.save(stl_path, binary=True)
-
-        progress_callback(100)
+def _image_values(img, mask=None):
+    """Vrátí 2D pole jasu (uint8, nebo float32 u obrázku "F") a masku."""
+    # Obrázek v režimu "LA" nese v alfa kanálu masku; model se pak sestaví
+    # jen z pixelů uvnitř masky.
+    if img.mode == "LA":
+        mask = img.getchannel("A")
+        img = img.getchannel("L")
+    elif img.mode in HIGH_DEPTH_MODES and img.mode != "F":
+        img = to_float_image(img)
+    values = np.asarray(img, dtype=np.float32 if img.mode == "F" else np.uint8)
+    return values, mask
+
+
+def _downscale(values, inside, params):
+    """
+    Zmenší 2D pole i masku na rozměry podle `mesh_grid_size`. Použije se
+    průměrování ploch (INTER_AREA, výpočet ve float32), které při zmenšení
+    zachová průměrnou výšku a je výrazně rychlejší než LANCZOS.
+    """
+    height, width = values.shape
+    size = mesh_grid_size(width, height, params)
+    if size == (width, height):
+        return values, inside
+    import cv2
+
+    values = np.asarray(values, dtype=np.float32)
+    values = cv2.resize(values, size, interpolation=cv2.INTER_AREA)
+    if inside is not None:
+        inside = inside.astype(np.float32)
+        inside = cv2.resize(inside, size, interpolation=cv2.INTER_AREA) >= 0.5
+    return values, inside
+
+
+def _mirror(values, inside, params):
+    """Zrcadlení jako pohled (bez kopie), pokud je vyžadováno."""
+    if not params.get("mirror_output", False):
+        return values, inside
+    return values[:, ::-1], None if inside is None else inside[:, ::-1]
+
+
+def _prepare_array(values, params, mask=None):
+    """
+    Připraví 2D pole jasu bez PIL (uint8, nebo float32 ve stupnici 0..255, tedy
+    výstup `processing.process_array`). Pole se nekopíruje: zrcadlení je pohled
+    a na výšky se převádí až po řádcích. `mask` je pole bool, nebo uint8
+    (uvnitř >= 128), případně obrázek "L".
+    Vrací (funkce výšek řádků v mm, šířka, výška, maska nebo None).
+    """
+    if values.ndim != 2:
+        raise ValueError("Výšková mapa musí být 2D pole.")
+    if values.dtype != np.uint8:
+        values = values.astype(np.float32, copy=False)
+    inside = None
+    if mask is not None:
+        mask = np.asarray(mask)
+        inside = mask if mask.dtype == bool else mask >= 128
+
+    values, inside = _downscale(values, inside, params)
+    values, inside = _mirror(values, inside, params)
+
+    def rows_mm(r0, r1, base_height, model_height):
+        return _heights_mm(values[r0:r1], base_height, model_height)
+
+    height, width = values.shape
+    return rows_mm, width, height, inside
+
+
+def _prepare_heightmap(heightmap, params):
+    """
+    Připraví výškovou mapu z .hmap souboru bez PIL: data zůstávají memmap
+    a zrcadlení je jen pohled, takže se řádky čtou z disku až při generování.
+    Zmenšení (viz `mesh_grid_size`) naopak načte celou mapu.
+    """
+    source, inside = _downscale(heightmap.data, heightmap.inside(), params)
+    source, inside = _mirror(source, inside, params)
+    scale = heightmap.scale
+
+    def rows_mm(r0, r1, base_height, model_height):
+        heights = np.array(source[r0:r1], dtype=np.float32)
+        heights *= np.float32(scale * model_height)
+        heights += np.float32(base_height)
+        return heights
+
+    height, width = source.shape
+    return rows_mm, width, height, inside
+
+
+# Hlavní funkce pro konverzi obrázku na STL.
+# Vstupem je zpracovaný PIL obrázek, 2D pole NumPy (výstup `process_array`) nebo
+# výšková mapa `Heightmap` z .hmap souboru a slovník s parametry. Výstupem je buď True (úspěch), nebo objekt výjimky (chyba).
+
+
+def image_to_stl(
+    processed_pil_image,
+    stl_path,
+    params,
+    progress_callback,
+    tracer=None,
+    cache=None,
+    mask=None,
+    cancel_check=None,
+):
+    """
+    Konvertuje zpracovaný obrázek na optimalizovaný STL soubor. Místo obrázku
+    lze předat 2D pole (uint8 nebo float32 ve stupnici 0..255, bez kopie),
+    nebo `heightmap_file.Heightmap`; parametry modelu z její hlavičky mají
+    přednost před `params`. Síť se sestavuje přímo v NumPy (plná mřížka
+    nebo adaptivní triangulace s omezenou chybou) a zapisuje bez PyVista.
+    Volitelný `tracer` (viz `instrumentation.Tracer`) zaznamená dobu, paměť
+    a počty prvků etap.
+    S `cache` (viz `export_cache.ExportCache`) se opakovaný export stejného
+    obrázku se stejnými parametry jen zkopíruje z cache. `mask` (obrázek "L"
+    nebo pole) omezí model na pixely uvnitř masky, stejně jako alfa kanál obrázku "LA".
+    `progress_callback(procenta, zbývající_s)` dostává průběh úměrný odvedené
+    práci a odhad zbývajícího času v sekundách (None, dokud není odhad
+    k dispozici); callback s jediným pozičním parametrem, např. `lambda p: ...`,
+    dostane jen procenta (viz `ExportProgress`). Vrátí-li
+    `cancel_check()` True, export se mezi dávkami práce přeruší a výsledkem
+    je `ProcessingCancelled`.
+    Výstup se zapisuje do dočasného souboru vedle `stl_path` a na jeho místo
+    se přesune až po úspěšném dokončení; zrušený nebo neúspěšný export tak
+    nezanechá rozepsaný soubor a dřívější soubor `stl_path` zůstane beze změny.
+    """
+    tracer = tracer or Tracer()
+    progress = ExportProgress(progress_callback, cancel_check)
+    partial_path = _partial_path(stl_path)
+    try:
+        key = None
+        if cache is not None:
+            with tracer.stage("stl.cache") as record:
+                suffix = os.path.splitext(stl_path)[1]
+                key = cache_key(processed_pil_image, params, suffix, mask)
+                record["hit"] = cache.fetch(key, partial_path)
+            if record["hit"]:
+                os.replace(partial_path, stl_path)
+                progress.finish()
+                return True
+
+        with tracer.profile("image_to_stl"):
+            _image_to_stl(
+                processed_pil_image, partial_path, params, progress, tracer, mask
+            )
+        os.replace(partial_path, stl_path)
+        if key is not None:
+            with tracer.stage("stl.cache_store"):
+                cache.store(key, stl_path)
         return True
 
+    except ProcessingCancelled as e:
+        print("Export STL zrušen.")
+        return e
+
     # Zachycení jakékoliv výjimky během procesu, výpis kompletního tracebacku do konzole a vrácení objektu chyby.
     except Exception as e:
         print("!!! CHYBA BĚHEM GENERACE STL !!!")
         traceback.print_exc()
         return e
+
+    # Po zrušení nebo chybě se smaže jen rozepsaný dočasný soubor.
+    finally:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+
+
+def _partial_path(stl_path):
+    """
+    Vrátí cestu dočasného souboru pro zápis exportu ve stejné složce jako
+    `stl_path` (aby šel atomicky přejmenovat). Přípona zůstává stejná, protože
+    podle ní se volí formát výstupu; proces a vlákno v názvu oddělí souběžné
+    exporty.
+    """
+    directory, name = os.path.split(stl_path)
+    tag = f"{os.getpid()}-{threading.get_ident()}"
+    return os.path.join(directory, f".{name}.{tag}.part.{mesh_format(stl_path)}")
+
+
+def _prepare_source(source, params, mask=None):
+    """
+    Připraví zdroj výšek (PIL obrázek, 2D pole nebo `Heightmap`) pro generování.
+    Vrací (parametry, funkce výšek řádků v mm, šířka, výška, maska nebo None);
+    u výškové mapy mají parametry z hlavičky přednost před `params`.
+    """
+    if isinstance(source, Heightmap):
+        params = {**params, **source.params}
+        return (params, *_prepare_heightmap(source, params))
+    if isinstance(source, np.ndarray):
+        return (params, *_prepare_array(source, params, mask))
+    return (params, *_prepare_image(source, params, mask))
+
+
+def _model_quads(inside):
+    """
+    Vrátí masku čtverců mřížky pro maskovaný model, nebo None, pokud maska
+    nic neořezává (model se pak sestaví z celé mřížky).
+    """
+    if inside is None:
+        return None
+    quads = mask_quads(inside)
+    if not quads.any():
+        raise ValueError("Maska neobsahuje žádnou plochu pro vytvoření modelu.")
+    return None if quads.all() else quads
+
+
+def _strip_plan(params, output_format, img_width, img_height, max_error):
+    """
+    Rozhodne o exportu pevného modelu po pásech. Vrací (řádků na pás, nebo None
+    pro sestavení celé sítě najednou; počet vláken). Po pásech se exportuje jen
+    plná mřížka: adaptivní síť (`max_error` není None) se sestaví vždy celá,
+    i při `streaming`, takže tolerance se nikdy tiše neignoruje.
+    """
+    # Počet vláken pro generování pásů; None znamená všechna jádra CPU.
+    workers = params.get("workers") or os.cpu_count() or 1
+    if max_error is not None:
+        return None, workers
+    streaming = params.get("streaming")
+    if streaming is None:
+        streaming = img_width * img_height > STREAMING_PIXEL_THRESHOLD
+
+    # Po pásech lze zapisovat jen binární STL (případně v gzipu); indexované
+    # formáty potřebují společnou tabulku vrcholů, proto se síť sestaví celá.
+    stl_records = params.get("is_binary", True) and output_format in ("stl", "stl.gz")
+    if not (stl_records and (streaming or workers > 1)):
+        return None, workers
+
+    strip_rows = params.get("strip_rows")
+    if not strip_rows:
+        strip_rows = strip_rows_for_width(img_width)
+        if workers > 1:
+            # Aspoň několik pásů na vlákno pro rovnoměrné rozložení práce.
+            per_worker = -(-img_height // (4 * workers))
+            strip_rows = min(strip_rows, max(MIN_PARALLEL_STRIP_ROWS, per_worker))
+    return strip_rows, workers
+
+
+def model_stats(source, params, mask=None, source_size=None, suffix=".stl"):
+    """
+    Spočítá statistiky modelu, který by ze stejných argumentů vytvořil
+    `image_to_stl`, analyticky bez sestavení sítě: rozměry mřížky, počet
+    trojúhelníků, velikost binárního STL, objem (integrál výšek přes triangulaci
+    horní plochy) a odhad hmotnosti filamentu při plné výplni. `suffix` je
+    přípona výstupu (ovlivňuje export po pásech, a tím počet trojúhelníků).
+
+    Počet trojúhelníků plné mřížky (i maskované a po pásech) je přesný;
+    u adaptivní sítě a samotného reliéfu je to horní mez (u maskovaného reliéfu
+    podle `relief_triangle_bound`) a `triangles_exact` je False. Reliéf bez
+    tloušťky nemá objem (None).
+
+    `source_size` (šířka, výška) je rozlišení výškové mapy, pokud je `source`
+    (PIL obrázek nebo pole) jen jejím zmenšeným náhledem: mřížka se určí podle
+    plného rozlišení a výšky i maska se do ní převzorkují z náhledu, objem je
+    pak odhad. Maska už převzorkovaná na mřížku sítě (viz `grid_mask`) se
+    použije beze změny.
+    """
+    if source_size is not None:
+        source, mask, params = _preview_grid(source, mask, params, source_size)
+    params, rows_mm, width, height, inside = _prepare_source(source, params, mask)
+    if width < 2 or height < 2:
+        raise ValueError("Obrázek je pro konverzi příliš malý.")
+    quads = _model_quads(inside)
+    scale_factor = params["model_width_mm"] / width
+    max_error = params.get("max_error_mm")
+    relief_only = params.get("export_relief_only", False)
+    margin = CUTTING_MARGIN_MM if params.get("use_cutting_margin", False) else 0.0
+    flat_bottom = params.get("flat_bottom", True)
+
+    if relief_only:
+        if quads is None:
+            triangles = 2 * (height - 1) * (width - 1)
+        else:
+            triangles = relief_triangle_bound(inside)
+        exact = False
+    elif quads is not None:
+        triangles = _solid_triangles(width, height, None, {"quads": quads})
+        exact = source_size is None
+        margin = 0.0
+    else:
+        options = {"flat_bottom": flat_bottom, "margin": margin}
+        # Stejné rozhodnutí o pásech jako při exportu.
+        strip_rows, _ = _strip_plan(
+            params, mesh_format(suffix), width, height, max_error
+        )
+        # Adaptivní síť má nejvýše tolik trojúhelníků jako plná mřížka.
+        triangles = _solid_triangles(width, height, strip_rows, options)
+        exact = max_error is None
+
+    volume = None
+    if not relief_only:
+        z = rows_mm(0, height, params["base_height"], params["model_height"])
+        # Čtverec mřížky jsou dva trojúhelníky se společnou úhlopříčkou mezi
+        # levým horním a pravým dolním rohem; objem hranolu pod trojúhelníkem
+        # je jeho plocha krát průměrná výška rohů.
+        where = True if quads is None else quads
+        corner = [
+            c.sum(dtype=np.float64, where=where)
+            for c in (z[:-1, :-1], z[:-1, 1:], z[1:, :-1], z[1:, 1:])
+        ]
+        weighted = 2 * corner[0] + corner[1] + corner[2] + 2 * corner[3]
+        volume = scale_factor**2 / 6 * weighted
+        if margin:
+            # Rámeček podstavy ve výšce podstavy kolem celé mřížky.
+            w_mm, h_mm = (width - 1) * scale_factor, (height - 1) * scale_factor
+            frame = (w_mm + 2 * margin) * (h_mm + 2 * margin) - w_mm * h_mm
+            volume += frame * params["base_height"]
+        volume = float(volume)
+
+    filament = None if volume is None else volume / 1000 * FILAMENT_DENSITY_G_CM3
+    return {
+        "grid": (width, height),
+        "triangles": int(triangles),
+        "triangles_exact": exact,
+        "stl_bytes": STL_HEADER_SIZE + 4 + STL_RECORD_DTYPE.itemsize * int(triangles),
+        "volume_mm3": volume,
+        "filament_g": filament,
+    }
+
+
+def _solid_triangles(width, height, strip_rows, options):
+    """
+    Přesný počet trojúhelníků pevného modelu z plné mřížky width x height
+    (`options` jako pro `build_solid_strip`), sestaveného po pásech
+    `strip_rows` řádků, nebo najednou při `strip_rows` None.
+    """
+    if options.get("quads") is not None:
+        return masked_triangles(options["quads"])
+    ranges = strip_ranges(height, strip_rows) if strip_rows else [(0, height - 1)]
+    return sum(
+        solid_strip_triangles(
+            r1 - r0 + 1,
+            width,
+            r0 == 0,
+            r1 == height - 1,
+            options["flat_bottom"],
+            options["margin"],
+        )
+        for r0, r1 in ranges
+    )
+
+
+def _preview_grid(source, mask, params, source_size):
+    """
+    Převzorkuje zmenšený náhled (a masku) na mřížku sítě určenou plným
+    rozlišením `source_size`. Vrací (pole, maska, parametry bez dalšího zmenšení).
+    """
+    import cv2
+
+    size = mesh_grid_size(*source_size, params)
+    if not isinstance(source, np.ndarray):
+        source, mask = _image_values(source, mask)
+    values = cv2.resize(
+        np.asarray(source, dtype=np.float32), size, interpolation=cv2.INTER_AREA
+    )
+    inside = None if mask is None else grid_mask(mask, size)
+    return values, inside, {**params, "max_dimension": 0, "feature_size_mm": None}
+
+
+def grid_mask(mask, size):
+    """
+    Převzorkuje masku (obrázek "L" nebo pole bool/uint8) na mřížku sítě
+    `size` (šířka, výška) jako pole bool. Maska, která už má tyto rozměry
+    a typ bool, se vrátí beze změny; volající si tak může převzorkovanou
+    masku uložit a předávat ji `model_stats` opakovaně.
+    """
+    import cv2
+
+    mask = np.asarray(mask)
+    if mask.dtype == bool and mask.shape == (size[1], size[0]):
+        return mask
+    inside = (mask if mask.dtype == bool else mask >= 128).astype(np.float32)
+    return cv2.resize(inside, size, interpolation=cv2.INTER_AREA) >= 0.5
+
+
+def _strip_records(x, y, z_rows, r0, r1, options):
+    """Sestaví jeden pás tělesa a rovnou ho převede na STL záznamy (s normálami)."""
+    vertices, faces = build_solid_strip(x, y, z_rows, r0, r1, **options)
+    return triangles_to_records(vertices, faces), len(vertices)
+
+
+def _iter_strip_records(x, y, z_rows, strip_rows, workers, options):
+    """
+    Generuje STL záznamy pásů tělesa ve výstupním pořadí jako trojice
+    (záznamy, počet vrcholů, r1). Při `workers > 1` se pásy počítají souběžně
+    ve vláknech (NumPy během výpočtu uvolňuje GIL); rozpracovaných pásů je
+    nejvýše `workers + 1`, takže paměť zůstává omezená.
+    """
+    ranges = strip_ranges(len(y), strip_rows)
+    if workers <= 1:
+        for r0, r1 in ranges:
+            yield (*_strip_records(x, y, z_rows, r0, r1, options), r1)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            for r0, r1 in ranges:
+                future = pool.submit(_strip_records, x, y, z_rows, r0, r1, options)
+                pending.append((future, r1))
+                if len(pending) > workers:
+                    future, last_row = pending.popleft()
+                    yield (*future.result(), last_row)
+            while pending:
+                future, last_row = pending.popleft()
+                yield (*future.result(), last_row)
+        finally:
+            # Při přerušení (zrušení exportu) se nezačaté pásy už nepočítají.
+            for future, _ in pending:
+                future.cancel()
+
+
+def _image_to_stl(processed_pil_image, stl_path, params, progress, tracer, mask=None):
+    # --- KROK 1: PŘÍPRAVA VSTUPNÍCH DAT ---
+    with tracer.stage("stl.prepare") as record:
+        params, rows_mm, img_width, img_height, inside = _prepare_source(
+            processed_pil_image, params, mask
+        )
+        record["pixels"] = img_width * img_height
+        if inside is not None:
+            record["masked_pixels"] = int(inside.sum())
+
+    # Kontrola, zda obrázek není příliš malý pro generování.
+    if img_width < 2 or img_height < 2:
+        raise ValueError("Obrázek je pro konverzi příliš malý.")
+
+    # Načtení parametrů modelu (cílové rozměry v mm) ze slovníku `params`.
+    model_width_mm = params["model_width_mm"]
+    base_height = params["base_height"]
+    model_height = params["model_height"]
+    # Výpočet měřítka pro převod pixelových souřadnic na reálné jednotky (milimetry).
+    scale_factor = model_width_mm / img_width
+    progress.check()
+
+    def z_rows(r0, r1):
+        return rows_mm(r0, r1, base_height, model_height)
+
+    quads = _model_quads(inside)
+    if quads is None:
+        inside = None
+
+    # Formát výstupu podle přípony (.stl, .stl.gz, .3mf, .ply); `is_binary`
+    # volí u .stl mezi binární a textovou variantou.
+    output_format = mesh_format(stl_path)
+    binary = params.get("is_binary", True)
+    # Cena zápisu jednoho trojúhelníku (pro průběh exportu).
+    text_stl = output_format == "stl" and not binary
+    write_cost = WORK_COST_NS["ascii" if text_stl else output_format]
+
+    # Přibližná svislá tolerance (mm) pro adaptivní triangulaci, měřená ve středech
+    # přepon (viz `adaptive_mesh`), ne zaručená maximální odchylka.
+    # None znamená plnou mřížku (každý pixel je vrchol).
+    max_error = params.get("max_error_mm")
+
+    # Zpracování speciálního případu pro export pouze 2.5D povrchu (bez tloušťky).
+
+    if params.get("export_relief_only", False):
+        print("Exportuji pouze 2.5D reliéf bez tloušťky.")
+
+        # Adaptivní triangulace vytvoří jen trojúhelníky potřebné pro přibližné
+        # dodržení tolerance, takže není nutná dodatečná decimace.
+        if max_error is None:
+            max_error = DEFAULT_RELIEF_MAX_ERROR
+        mesh_work = img_width * img_height * WORK_COST_NS["adaptive"]
+        progress.expect(mesh_work)
+        mesh_progress = progress.part(mesh_work)
+        with tracer.stage("stl.mesh", mode="relief") as record:
+            x = np.arange(img_width, dtype=np.float32) * scale_factor
+            y = np.arange(img_height, dtype=np.float32) * scale_factor
+            vertices, faces = build_adaptive_relief(
+                x, y, z_rows(0, img_height), max_error, inside, mesh_progress
+            )
+            record.update(vertices=len(vertices), triangles=len(faces))
+        if not len(faces):
+            raise ValueError("Maska neobsahuje žádnou plochu pro vytvoření reliéfu.")
+        mesh_progress(1, 1)
+        print(f"Reliéf vytvořen s {len(faces)} trojúhelníky.")
+        write_work = len(faces) * write_cost
+        progress.expect(write_work)
+        with tracer.stage("stl.write", triangles=len(faces)) as record:
+            write_mesh(stl_path, vertices, faces, binary, progress.part(write_work))
+            record.update(format=output_format, bytes=os.path.getsize(stl_path))
+        progress.finish()
+        return True
+
+    # --- LOGIKA PRO VŠECHNY PEVNÉ MODELY ---
+    # Vytvoření mřížky XY souřadnic pro horní (reliéf) a spodní (podstava) plochu.
+
+    # Souřadnice zůstávají 1D (float32); do vrcholů se rozkopírují broadcastingem.
+    x = np.arange(img_width, dtype=np.float32) * np.float32(scale_factor)
+    y = np.arange(img_height, dtype=np.float32) * np.float32(scale_factor)
+
+    # Spodní plocha a rámeček se sestavují přímo (bez booleovských operací):
+    # rovná podstava je hrubý vějíř napojený na boční stěny a "cutting margin"
+    # je rámeček podstavy přesahující reliéf na každé straně ve výšce podstavy.
+    margin = CUTTING_MARGIN_MM if params.get("use_cutting_margin", False) else 0.0
+    options = {
+        "flat_bottom": params.get("flat_bottom", True),
+        "margin": margin,
+        "z_frame": base_height,
+    }
+    if quads is not None:
+        # Maskovaný model: síť jen uvnitř masky se stěnami po jejím obrysu
+        # (plná mřížka; spodní plocha je vždy rovná, bez rámečku).
+        options = {"quads": quads}
+        max_error = None
+
+    strip_rows, workers = _strip_plan(
+        params, output_format, img_width, img_height, max_error
+    )
+    if strip_rows:
+        # Export po horizontálních pásech: pásy se generují (případně paralelně)
+        # a ve správném pořadí rovnou připojují do souboru, paměť je omezena
+        # velikostí pásu a počtem vláken.
+        print("Vytvářím a ukládám 3D těleso po pásech...")
+        triangles = _solid_triangles(img_width, img_height, strip_rows, options)
+        strip_cost = WORK_COST_NS["mesh"] + WORK_COST_NS["stl"]
+        # U .stl.gz se soubor komprimuje až po zápisu všech pásů.
+        compress_work = triangles * max(0, write_cost - WORK_COST_NS["stl"])
+        progress.expect(triangles * strip_cost + compress_work)
+        with tracer.stage("stl.stream", workers=workers) as record:
+            compress_progress = progress.part(compress_work)
+            with StlStreamWriter(stl_path, progress=compress_progress) as writer:
+                for records, vertex_count, _ in _iter_strip_records(
+                    x, y, z_rows, strip_rows, workers, options
+                ):
+                    writer.write_records(records)
+                    tracer.count(strips=1, vertices=vertex_count)
+                    progress.advance(len(records) * strip_cost)
+            record.update(
+                triangles=writer.count,
+                format=output_format,
+                bytes=os.path.getsize(stl_path),
+            )
+        print(f"Model vytvořen s {writer.count} trojúhelníky.")
+        progress.finish()
+        return True
+
+    # Přímá konstrukce vodotěsného tělesa: horní reliéf, spodní plocha v nule,
+    # čtyři boční stěny napojené na okraj mřížky a případně rámeček podstavy.
+    print("Vytvářím 3D těleso z výškové mapy...")
+    if max_error is None:
+        triangles = _solid_triangles(img_width, img_height, None, options)
+        mesh_work = triangles * WORK_COST_NS["mesh"]
+        # Počet trojúhelníků plné mřížky je předem známý, plánuje se i zápis.
+        progress.expect(mesh_work + triangles * write_cost)
+    else:
+        mesh_work = img_width * img_height * WORK_COST_NS["adaptive"]
+        progress.expect(mesh_work)
+    mesh_progress = progress.part(mesh_work)
+    with tracer.stage("stl.mesh", mode="solid") as record:
+        # Výpočet Z souřadnic pro horní plochu na základě výškové mapy.
+        zz_top = z_rows(0, img_height)
+        progress.check()
+        if max_error is None:
+            vertices, faces = build_solid_mesh(x, y, zz_top, 0.0, **options)
+        else:
+            vertices, faces = build_adaptive_solid(
+                x, y, zz_top, max_error, 0.0, margin, base_height, mesh_progress
+            )
+        record.update(vertices=len(vertices), triangles=len(faces))
+    mesh_progress(1, 1)
+    print(f"Model vytvořen s {len(faces)} trojúhelníky.")
+
+    write_work = len(faces) * write_cost
+    if max_error is not None:
+        progress.expect(write_work)
+    print(f"Ukládám finální soubor ({output_format})...")
+    with tracer.stage("stl.write", triangles=len(faces)) as record:
+        write_mesh(stl_path, vertices, faces, binary, progress.part(write_work))
+        record.update(format=output_format, bytes=os.path.getsize(stl_path))
+
+    progress.finish()
+    return True